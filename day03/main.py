@@ -1,10 +1,18 @@
+import bisect
 import io
-from collections import defaultdict
-from typing import Optional
+import re
+from array import array
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Optional, Self, Sequence
+
+import numpy as np
 
 
 class Part01:
     NON_SYMBOLS = ("0", "1", "2", "3", "4", "5", "6", "7", "8", "9", ".")
+    # Numbers with more digits may not fit in int64
+    MAX_INT64_DIGITS = 18
 
     @classmethod
     def is_adjacent_to_symbol(
@@ -90,6 +98,86 @@ class Part01:
         res += cls.parse_array(rows, -1)
         return res
 
+    @classmethod
+    def load_grid(cls, f: io.TextIOWrapper) -> np.ndarray:
+        """Load the schematic as a 2D array of chars, surrounded by a border of '.'
+        Shorter rows are also padded with '.'
+
+        Rows are copied into the grid as they are read, its capacity is doubled
+        when it is full, and trimmed in place at the end
+        """
+        grid = np.full((16, 2), ord("."), dtype=np.uint8)
+        nb_rows = 0
+        for line in f:
+            row = line.strip().encode()
+            if nb_rows + 2 > len(grid) - 1:
+                grid.resize((2 * len(grid), grid.shape[1]), refcheck=False)
+                grid[nb_rows + 1 :] = ord(".")
+            if len(row) + 2 > grid.shape[1]:
+                grid = np.pad(
+                    grid,
+                    ((0, 0), (0, len(row) + 2 - grid.shape[1])),
+                    constant_values=ord("."),
+                )
+            grid[nb_rows + 1, 1 : len(row) + 1] = np.frombuffer(row, dtype=np.uint8)
+            nb_rows += 1
+        grid.resize((nb_rows + 2, grid.shape[1]), refcheck=False)
+        return grid
+
+    @classmethod
+    def sum_part_numbers(cls, grid: np.ndarray) -> int:
+        """Sum every number adjacent to a symbol, in a grid from load_grid"""
+        is_digit = (grid >= ord("0")) & (grid <= ord("9"))
+        is_symbol = ~is_digit & (grid != ord("."))
+
+        # Cells next to a symbol, dilating the symbols horizontally then vertically
+        is_near_row_symbol = is_symbol.copy()
+        is_near_row_symbol[:, 1:] |= is_symbol[:, :-1]
+        is_near_row_symbol[:, :-1] |= is_symbol[:, 1:]
+        del is_symbol
+        is_near_symbol = is_near_row_symbol.copy()
+        is_near_symbol[1:] |= is_near_row_symbol[:-1]
+        is_near_symbol[:-1] |= is_near_row_symbol[1:]
+        del is_near_row_symbol
+
+        # Label each run of digits; thanks to the border, runs never span two rows
+        flat_digits = is_digit.ravel()
+        digits_idx = np.flatnonzero(flat_digits)
+        if not len(digits_idx):
+            return 0
+        is_run_start = flat_digits[digits_idx] & ~flat_digits[digits_idx - 1]
+        is_run_end = ~flat_digits[digits_idx + 1]
+        run_ids = np.cumsum(is_run_start) - 1
+        run_starts = digits_idx[is_run_start]
+        run_ends = digits_idx[is_run_end]
+
+        is_part = np.zeros(len(run_ends), dtype=np.bool_)
+        np.logical_or.at(is_part, run_ids, is_near_symbol.ravel()[digits_idx])
+
+        longest_run = int((run_ends - run_starts).max()) + 1
+        if longest_run > cls.MAX_INT64_DIGITS:
+            # Too long for int64, parse them with python ints instead
+            flat_grid = grid.ravel()
+            return sum(
+                int(flat_grid[start : end + 1].tobytes())
+                for start, end in zip(
+                    run_starts[is_part].tolist(), run_ends[is_part].tolist()
+                )
+            )
+
+        # Value of each run, as the sum of its digits times their power of 10
+        digits = grid.ravel()[digits_idx].astype(np.int64) - ord("0")
+        powers = 10 ** (run_ends[run_ids] - digits_idx)
+        values = np.zeros(len(run_ends), dtype=np.int64)
+        np.add.at(values, run_ids, digits * powers)
+        # The sum itself may not fit in int64
+        return sum(values[is_part].tolist())
+
+    @classmethod
+    def _parse_file_numpy(cls, f: io.TextIOWrapper) -> int:
+        """Same as _parse_file, processing the whole schematic at once with numpy"""
+        return cls.sum_part_numbers(cls.load_grid(f))
+
     @classmethod
     def test_is_adjacent_to_symbol(cls):
         assert cls.is_adjacent_to_symbol(
@@ -277,21 +365,164 @@ class Part01:
         )
         assert cls._parse_file(f) == 7 + 8 + 145 + 629 + 89 + 817 + 880
 
+    @classmethod
+    def test_parse_file_numpy(cls):
+        # Provided test case
+        f = io.StringIO(
+            """467..114..
+...*......
+..35..633.
+......#...
+617*......
+.....+.58.
+..592.....
+......755.
+...$.*....
+.664.598.."""
+        )
+        assert cls._parse_file_numpy(f) == 4361
+
+        # Custom testcases
+        for schematic in (
+            "..........\n.......998\n..........",
+            "..8...145..629..\n...*.....-..&...\n59..489.817.880.",
+            "7.8*..145..629.\n***************\n.....89.817.880",
+            "12\n3*\n..45",
+            "*",
+        ):
+            assert cls._parse_file_numpy(io.StringIO(schematic)) == cls._parse_file(
+                io.StringIO(schematic)
+            )
+        assert cls._parse_file_numpy(io.StringIO("")) == 0
+
+        # Numbers too big for int64, and many rows
+        schematic = "\n".join(["1" * 30 + "*" + "9" * 18] * 40)
+        assert cls._parse_file_numpy(io.StringIO(schematic)) == 40 * (
+            int("1" * 30) + int("9" * 18)
+        )
+        schematic = "\n".join(["9" * 18 + "*"] * 40)
+        assert cls._parse_file_numpy(io.StringIO(schematic)) == 40 * int("9" * 18)
+
     @classmethod
     def parse_file(cls) -> int:
         with open("input.txt", "r") as f:
             return cls._parse_file(f)
 
 
+@dataclass
+class GearIndex:
+    """Every number span of a schematic, and the spans adjacent to each gear
+
+    Span i is the number values[i], on row rows[i], in columns [starts[i], ends[i])
+    """
+
+    NUMBER_PATTERN = re.compile(r"\d+")
+
+    rows: array = field(default_factory=lambda: array("q"))
+    starts: array = field(default_factory=lambda: array("q"))
+    ends: array = field(default_factory=lambda: array("q"))
+    # Numbers may not fit in int64, so they are kept as python ints
+    values: list[int] = field(default_factory=list)
+    # Indexes of every span adjacent to each gear position
+    gear_to_spans: dict[tuple[int, int], list[int]] = field(default_factory=dict)
+
+    def add_span(self, row: int, start: int, end: int, value: int) -> int:
+        """Record a number span, and return its index"""
+        self.rows.append(row)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.values.append(value)
+        return len(self.values) - 1
+
+    def link_spans(self, spans: list[int], row: int, gear_cols: list[int]):
+        """Link each span to every gear of row (sorted columns) touching it"""
+        for span in spans:
+            start, end = self.starts[span], self.ends[span]
+            i = bisect.bisect_left(gear_cols, start - 1)
+            while i < len(gear_cols) and gear_cols[i] <= end:
+                self.gear_to_spans[(row, gear_cols[i])].append(span)
+                i += 1
+
+    @classmethod
+    def from_lines(cls, lines: Iterable[str]) -> Self:
+        """Index a schematic in a single pass over its rows
+
+        Args:
+            lines (Iterable[str]): rows of the schematic
+
+        Returns:
+            Self: index of the schematic
+        """
+        index = cls()
+        prev_spans: list[int] = []
+        prev_gear_cols: list[int] = []
+
+        for row, line in enumerate(lines):
+            line = line.strip()
+            spans = [
+                index.add_span(row, match.start(), match.end(), int(match.group()))
+                for match in cls.NUMBER_PATTERN.finditer(line)
+            ]
+            gear_cols = [col for col, char in enumerate(line) if char == "*"]
+            for col in gear_cols:
+                index.gear_to_spans[(row, col)] = []
+
+            index.link_spans(spans, row - 1, prev_gear_cols)
+            index.link_spans(prev_spans + spans, row, gear_cols)
+            prev_spans, prev_gear_cols = spans, gear_cols
+
+        return index
+
+    def get_gear_numbers(self, gear_pos: tuple[int, int]) -> list[int]:
+        """Numbers adjacent to the gear at gear_pos, empty if there is no gear"""
+        return [self.values[span] for span in self.gear_to_spans.get(gear_pos, ())]
+
+    def get_gear_ratio(self, gear_pos: tuple[int, int]) -> Optional[int]:
+        """Ratio of the gear at gear_pos, None if it has not exactly two numbers"""
+        spans = self.gear_to_spans.get(gear_pos, ())
+        if len(spans) != 2:
+            return None
+        return self.values[spans[0]] * self.values[spans[1]]
+
+    def get_gear_ratios_sum(self) -> int:
+        return sum(
+            self.values[spans[0]] * self.values[spans[1]]
+            for spans in self.gear_to_spans.values()
+            if len(spans) == 2
+        )
+
+    @classmethod
+    def test_from_lines(cls):
+        index = cls.from_lines(["12*..", "..3*4", "*5..."])
+        assert list(index.rows) == [0, 1, 1, 2]
+        assert list(index.starts) == [0, 2, 4, 1]
+        assert list(index.ends) == [2, 3, 5, 2]
+        assert index.values == [12, 3, 4, 5]
+        # 3 touches both gears
+        assert index.gear_to_spans == {(0, 2): [0, 1], (1, 3): [1, 2], (2, 0): [3]}
+        assert index.get_gear_numbers((1, 3)) == [3, 4]
+        assert index.get_gear_numbers((0, 0)) == []
+        assert index.get_gear_ratio((0, 2)) == 36
+        assert index.get_gear_ratio((2, 0)) is None
+        assert index.get_gear_ratios_sum() == 36 + 12
+
+        assert cls.from_lines([]).get_gear_ratios_sum() == 0
+
+        # Numbers too big for int64
+        index = cls.from_lines(["1" * 25 + "*" + "2" * 25])
+        assert index.values == [int("1" * 25), int("2" * 25)]
+        assert index.get_gear_ratios_sum() == int("1" * 25) * int("2" * 25)
+
+
 class Part02:
     @classmethod
     def get_adjacent_gear_pos(
-        cls, array: list[str], start: int, end: int, row: int
+        cls, array: Sequence[str], start: int, end: int, row: int
     ) -> Optional[tuple[int, int]]:
         """Check if the string delimited by [start, end) has a gear around it, and returns its position
 
         Args:
-            array (list[str]): array to check
+            array (Sequence[str]): array to check
             start (int): start of the string (inclusive)
             end (int): end of the string (exclusive)
             row (int): row to check
@@ -334,11 +565,11 @@ class Part02:
             return (row + 1, gear_y_pos)
 
     @classmethod
-    def parse_array(cls, array: list[str], row: int) -> dict:
+    def parse_array(cls, array: Sequence[str], row: int) -> dict:
         """Parse the array to find every number in row surrounded by a symbol
 
         Args:
-            array (list[str]): array to check
+            array (Sequence[str]): array to check
             row (int): row to check
 
         Returns:
@@ -366,32 +597,64 @@ class Part02:
         return gear_to_numbers
 
     @classmethod
-    def _parse_file(cls, f: io.TextIOWrapper) -> int:
-        res = 0
-        rows = []
-        gear_to_numbers = defaultdict(list)
+    def get_gear_ratios(cls, gear_to_numbers: dict) -> Iterator[int]:
+        """Yield the ratio of every gear adjacent to exactly two numbers
 
-        idx = 0
+        Args:
+            gear_to_numbers (dict): numbers adjacent to each gear
 
-        for idx, line in enumerate(f):
+        Yields:
+            Iterator[int]: product of the two numbers of each gear
+        """
+        for numbers in gear_to_numbers.values():
+            if len(numbers) == 2:
+                yield numbers[0] * numbers[1]
+
+    @classmethod
+    def iter_gear_ratios(cls, lines: Iterable[str]) -> Iterator[int]:
+        """Yield the gear ratios, each one as soon as no later row can change it
+
+        Only a window of three rows is kept, along with the numbers found around
+        the gears of each of these rows. A gear can only get numbers from the row
+        above, its own row and the row below, so once its row leaves the window
+        its ratio is emitted and it is evicted. Memory is O(row width).
+
+        Args:
+            lines (Iterable[str]): rows of the schematic
+
+        Yields:
+            Iterator[int]: gear ratios, in the order of their rows
+        """
+        rows: deque[str] = deque(maxlen=3)
+        # gears[i] holds the numbers around the gears of rows[i], keyed by column
+        gears: deque[defaultdict] = deque(maxlen=3)
+
+        def parse_row(row: int):
+            for (gear_row, gear_col), numbers in cls.parse_array(rows, row).items():
+                gears[gear_row][gear_col] += numbers
+
+        for line in lines:
+            if len(rows) == 3:
+                yield from cls.get_gear_ratios(gears[0])
             rows.append(line.strip())
-            if idx == 1:
-                for gear_pos, numbers in cls.parse_array(rows, 0).items():
-                    gear_to_numbers[gear_pos] += numbers
-            elif len(rows) == 3:
-                for gear_pos, numbers in cls.parse_array(rows, 1).items():
-                    gear_to_numbers[(gear_pos[0] + idx - 2, gear_pos[1])] += numbers
-                rows.pop(0)
+            gears.append(defaultdict(list))
+            if len(rows) >= 2:
+                # The row below the previous one is now known
+                parse_row(len(rows) - 2)
 
-        for gear_pos, numbers in cls.parse_array(rows, -1).items():
-            gear_to_numbers[(gear_pos[0] + idx - 1, gear_pos[1])] += numbers
+        if rows:
+            parse_row(len(rows) - 1)
+        for gear_to_numbers in gears:
+            yield from cls.get_gear_ratios(gear_to_numbers)
 
-        # Compute product of all relevant gears
-        res = 0
-        for numbers in gear_to_numbers.values():
-            if len(numbers) == 2:
-                res += numbers[0] * numbers[1]
-        return res
+    @classmethod
+    def _parse_file(cls, f: io.TextIOWrapper) -> int:
+        return sum(cls.iter_gear_ratios(f))
+
+    @classmethod
+    def _parse_file_index(cls, f: io.TextIOWrapper) -> int:
+        """Same as _parse_file, but numbers count for every gear they touch"""
+        return GearIndex.from_lines(f).get_gear_ratios_sum()
 
     @classmethod
     def test_get_adjacent_gear_pos(cls):
@@ -424,6 +687,29 @@ class Part02:
 .664.598.."""
         )
         assert cls._parse_file(f) == 467 * 35 + 755 * 598
+        f.seek(0)
+        assert cls._parse_file_index(f) == 467 * 35 + 755 * 598
+
+    @classmethod
+    def test_iter_gear_ratios(cls):
+        # Ratios come out as soon as the window has moved past their row
+        schematic = ["1*2....", ".......", ".......", "3......", "*......", "4......"]
+        nb_read_rows = 0
+
+        def read_rows():
+            nonlocal nb_read_rows
+            for row in schematic:
+                nb_read_rows += 1
+                yield row
+
+        ratios = cls.iter_gear_ratios(read_rows())
+        assert next(ratios) == 2
+        assert nb_read_rows == 4
+        assert list(ratios) == [12]
+
+        # Single row and empty schematics
+        assert list(cls.iter_gear_ratios(["10*10"])) == [100]
+        assert list(cls.iter_gear_ratios([])) == []
 
     @classmethod
     def parse_file(cls) -> int:
@@ -435,8 +721,11 @@ if __name__ == "__main__":
     Part01.test_is_adjacent_to_symbol()
     Part01.test_parse_array()
     Part01.test_parse_file()
+    Part01.test_parse_file_numpy()
+    GearIndex.test_from_lines()
     Part02.test_get_adjacent_gear_pos()
     Part02.test_parse_file()
+    Part02.test_iter_gear_ratios()
 
     print(Part01.parse_file())
     print(Part02.parse_file())
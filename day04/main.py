@@ -1,9 +1,19 @@
 import io
-from collections import defaultdict
+import re
+from collections import defaultdict, deque
 from io import TextIOWrapper
+from typing import Iterable, Iterator
+
+import numpy as np
 
 
 class Part01:
+    # Numbers below this are counted with bitmasks, see count_matches
+    MAX_BITMASK_NB = 1 << 16
+    CARD_ID_PATTERN = re.compile(r"^[^\n:]*:", re.MULTILINE)
+    # Max size of the temporary boolean arrays of get_nb_matching_numbers_batch
+    MAX_CHUNK_BYTES = 1 << 24
+
     @classmethod
     def get_nb_matching_numbers(cls, line: str):
         # Discard the CardID part
@@ -11,11 +21,32 @@ class Part01:
         winning_nbs_row, player_nbs_row, *_ = line.split("|")
         winning_nbs = [int(x) for x in winning_nbs_row.split()]
         player_nbs = [int(x) for x in player_nbs_row.split()]
+        return cls.count_matches(winning_nbs, player_nbs)
 
-        matches = 0
-        for player_nb in player_nbs:
-            matches += int(player_nb in winning_nbs)
-        return matches
+    @classmethod
+    def to_bitmask(cls, nbs: list[int]) -> int:
+        """Encode numbers as an int where bit n is set if n is in nbs
+        Numbers must be in [0, MAX_BITMASK_NB)
+        """
+        bitmask = 0
+        for nb in nbs:
+            bitmask |= 1 << nb
+        return bitmask
+
+    @classmethod
+    def count_matches(cls, winning_nbs: list[int], player_nbs: list[int]) -> int:
+        """Count player numbers that are in winning numbers"""
+        all_nbs = winning_nbs + player_nbs
+        if not all_nbs or (min(all_nbs) >= 0 and max(all_nbs) < cls.MAX_BITMASK_NB):
+            winning_bitmask = cls.to_bitmask(winning_nbs)
+            player_bitmask = cls.to_bitmask(player_nbs)
+            # Each player number is counted, even if it's there twice
+            if player_bitmask.bit_count() == len(player_nbs):
+                return (winning_bitmask & player_bitmask).bit_count()
+            return sum(winning_bitmask >> nb & 1 for nb in player_nbs)
+        # Bitmasks would be as big as the largest number, use a set instead
+        winning_set = set(winning_nbs)
+        return sum(nb in winning_set for nb in player_nbs)
 
     @classmethod
     def parse_line(cls, line: str):
@@ -32,6 +63,138 @@ class Part01:
         assert cls.parse_line("Card 4: 41 92 73 84 69 | 59 84 76 51 58  5 54 83") == 1
         assert cls.parse_line("Card 6: 31 18 13 56 72 | 74 77 10 23 35 67 36 11") == 0
 
+    @classmethod
+    def test_count_matches(cls):
+        assert (
+            cls.count_matches([41, 48, 83, 86, 17], [83, 86, 6, 31, 17, 9, 48, 53]) == 4
+        )
+        assert cls.count_matches([1, 2], [3, 4]) == 0
+        assert cls.count_matches([], [3, 4]) == 0
+        # Duplicated numbers
+        assert cls.count_matches([1, 1, 2], [1, 5]) == 1
+        assert cls.count_matches([1, 2], [1, 1, 2]) == 3
+        # Numbers too big or negative for bitmasks
+        assert cls.count_matches([10**9, 5], [10**9, 7]) == 1
+        assert cls.count_matches([-1, 2], [-1, -1, 2, 3]) == 3
+        assert (
+            cls.count_matches([cls.MAX_BITMASK_NB - 1], [cls.MAX_BITMASK_NB - 1]) == 1
+        )
+        assert cls.count_matches([cls.MAX_BITMASK_NB], [cls.MAX_BITMASK_NB] * 2) == 2
+
+    @classmethod
+    def _parse_file_batch(cls, f: TextIOWrapper) -> tuple[np.ndarray, np.ndarray]:
+        """Parse every card at once
+
+        The whole file is parsed by numpy, with each "Card n:" replaced by -2 and
+        each "|" by -1, so that numbers can then be split between cards without
+        going through each line
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]:
+            - (n, nb winning numbers) matrix of winning numbers
+            - (n, nb player numbers) matrix of player numbers
+            Rows are padded with -1 for winning numbers, and -2 for player numbers
+            if cards don't all have the same amount of numbers, so they never match
+        """
+        text = cls.CARD_ID_PATTERN.sub(" -2 ", f.read()).replace("|", " -1 ")
+        values = np.fromstring(text, dtype=np.int64, sep=" ")
+        card_starts = np.flatnonzero(values == -2)
+        splits = np.flatnonzero(values == -1)
+        card_ends = np.append(card_starts, len(values))[1:]
+        return (
+            cls._to_matrix(values, card_starts + 1, splits, -1),
+            cls._to_matrix(values, splits + 1, card_ends, -2),
+        )
+
+    @classmethod
+    def _to_matrix(
+        cls, values: np.ndarray, starts: np.ndarray, ends: np.ndarray, padding: int
+    ) -> np.ndarray:
+        """Put values[starts[i]:ends[i]] in row i of a matrix, padded with padding"""
+        lengths = ends - starts
+        width = lengths.max(initial=0)
+        matrix = np.full((len(lengths), width), padding, dtype=np.int64)
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        # Position of each value inside its row
+        cols = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        matrix[rows, cols] = values[np.repeat(starts, lengths) + cols]
+        return matrix
+
+    @classmethod
+    def get_nb_matching_numbers_batch(
+        cls, winning_nbs: np.ndarray, player_nbs: np.ndarray
+    ) -> np.ndarray:
+        """Vectorized version of get_nb_matching_numbers, for every card at once
+
+        Cards are compared by chunks, so that comparing every player number to
+        every winning number never takes more than MAX_CHUNK_BYTES
+        """
+        matches = np.zeros(len(player_nbs), dtype=np.int64)
+        nb_comparisons = max(player_nbs.shape[1] * winning_nbs.shape[1], 1)
+        chunk_size = max(cls.MAX_CHUNK_BYTES // nb_comparisons, 1)
+        for start in range(0, len(player_nbs), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            is_winning = (
+                player_nbs[chunk, :, np.newaxis] == winning_nbs[chunk, np.newaxis, :]
+            ).any(axis=2)
+            matches[chunk] = is_winning.sum(axis=1)
+        return matches
+
+    @classmethod
+    def get_score_batch(cls, matches: np.ndarray) -> int:
+        # Scores overflow int64 from 64 matches, so they are computed with python ints
+        # once per distinct number of matches
+        return sum(
+            nb_cards * 2 ** (nb_matches - 1)
+            for nb_matches, nb_cards in enumerate(np.bincount(matches).tolist())
+            if nb_matches and nb_cards
+        )
+
+    @classmethod
+    def _test_helper_get_example_input(cls) -> TextIOWrapper:
+        """Returns the example input in a TextIOWrapper"""
+        return io.StringIO(
+            """Card 1: 41 48 83 86 17 | 83 86  6 31 17  9 48 53
+Card 2: 13 32 20 16 61 | 61 30 68 82 17 32 24 19
+Card 3:  1 21 53 59 44 | 69 82 63 72 16 21 14  1
+Card 4: 41 92 73 84 69 | 59 84 76 51 58  5 54 83
+Card 5: 87 83 26 28 32 | 88 30 70 12 93 22 82 36
+Card 6: 31 18 13 56 72 | 74 77 10 23 35 67 36 11"""
+        )
+
+    @classmethod
+    def test_get_score_batch(cls):
+        winning_nbs, player_nbs = cls._parse_file_batch(
+            cls._test_helper_get_example_input()
+        )
+        assert winning_nbs.shape == (6, 5)
+        assert player_nbs.shape == (6, 8)
+        matches = cls.get_nb_matching_numbers_batch(winning_nbs, player_nbs)
+        assert matches.tolist() == [4, 2, 2, 1, 0, 0]
+        # Provided test case
+        assert cls.get_score_batch(matches) == 13
+
+        # Cards with different amounts of numbers, and duplicated numbers
+        winning_nbs, player_nbs = cls._parse_file_batch(
+            io.StringIO("Card 1: 1 2 | 1 1 3\nCard 2: 4 | 4")
+        )
+        assert winning_nbs.tolist() == [[1, 2], [4, -1]]
+        assert player_nbs.tolist() == [[1, 1, 3], [4, -2, -2]]
+        matches = cls.get_nb_matching_numbers_batch(winning_nbs, player_nbs)
+        assert matches.tolist() == [2, 1]
+
+        # Scores too big for int64
+        line = f"Card 1: {' '.join(map(str, range(70)))} | {' '.join(map(str, range(100)))}"
+        winning_nbs, player_nbs = cls._parse_file_batch(io.StringIO(f"{line}\n{line}"))
+        matches = cls.get_nb_matching_numbers_batch(winning_nbs, player_nbs)
+        assert matches.tolist() == [70, 70]
+        assert cls.get_score_batch(matches) == 2 * cls.parse_line(line) == 2**70
+        assert cls.get_score_batch(np.array([], dtype=np.int64)) == 0
+
+        winning_nbs, player_nbs = cls._parse_file_batch(io.StringIO(""))
+        assert winning_nbs.shape == player_nbs.shape == (0, 0)
+        assert cls.get_nb_matching_numbers_batch(winning_nbs, player_nbs).tolist() == []
+
     @classmethod
     def parse_file(cls) -> int:
         res = 0
@@ -56,6 +219,51 @@ class Part02(Part01):
                 possessed_cards[idx + i + 1] += possessed_cards[idx]
         return sum(possessed_cards.values())
 
+    @classmethod
+    def iter_total_cards(cls, lines: Iterable[str]) -> Iterator[int]:
+        """Yield the total number of possessed cards after each card
+
+        Args:
+            lines (Iterable[str]): cards, one per line
+
+        Yields:
+            Iterator[int]: running total of possessed cards
+        """
+        return cls.iter_total_cards_from_matches(map(cls.parse_line, lines))
+
+    @classmethod
+    def iter_total_cards_from_matches(cls, matches: Iterable[int]) -> Iterator[int]:
+        """Yield the total number of possessed cards after each card
+
+        Only the copies won for the next cards are kept, as a difference array:
+        pending_copies[i] is how much the won copies change when reaching the
+        (i + 1)-th next card. Memory is bounded by the max number of matches.
+        Cards never make you win copies of cards past the end of the table,
+        so they are not counted.
+
+        Args:
+            matches (Iterable[int]): number of matching numbers of each card
+
+        Yields:
+            Iterator[int]: running total of possessed cards
+        """
+        total = 0
+        won_copies = 0
+        pending_copies: deque[int] = deque()
+        for nb_matches in matches:
+            if pending_copies:
+                won_copies += pending_copies.popleft()
+            nb_copies = won_copies + 1
+            total += nb_copies
+
+            if nb_matches:
+                while len(pending_copies) <= nb_matches:
+                    pending_copies.append(0)
+                # Next `nb_matches` cards each get nb_copies more copies
+                pending_copies[0] += nb_copies
+                pending_copies[nb_matches] -= nb_copies
+            yield total
+
     @classmethod
     def test_parse_file(cls):
         # Provided test case
@@ -69,15 +277,71 @@ Card 6: 31 18 13 56 72 | 74 77 10 23 35 67 36 11"""
         )
         assert cls._parse_file(f) == 30
 
+    @classmethod
+    def get_total_cards_batch(cls, matches: np.ndarray) -> int:
+        """Same as _parse_file, from the matches of get_nb_matching_numbers_batch
+
+        The copies of a card depend on the copies of the previous cards, so the
+        cascade cannot be vectorized. It goes through the difference array of
+        iter_total_cards_from_matches, with python ints as the number of copies
+        grows exponentially and overflows int64.
+        """
+        total = 0
+        for total in cls.iter_total_cards_from_matches(matches.tolist()):
+            pass
+        return total
+
+    @classmethod
+    def test_get_total_cards_batch(cls):
+        winning_nbs, player_nbs = cls._parse_file_batch(
+            cls._test_helper_get_example_input()
+        )
+        matches = cls.get_nb_matching_numbers_batch(winning_nbs, player_nbs)
+        # Provided test case
+        assert cls.get_total_cards_batch(matches) == 30
+
+        # Totals too big for int64
+        # Each card wins the next 2, without going past the end of the table
+        lines = [f"Card {idx}: 1 2 | 1 2" for idx in range(118)]
+        lines += ["Card 118: 1 2 | 1 3", "Card 119: 1 2 | 3 4"]
+        winning_nbs, player_nbs = cls._parse_file_batch(io.StringIO("\n".join(lines)))
+        matches = cls.get_nb_matching_numbers_batch(winning_nbs, player_nbs)
+        assert cls.get_total_cards_batch(matches) == cls._parse_file(
+            io.StringIO("\n".join(lines))
+        )
+        assert cls.get_total_cards_batch(matches) > 2**63
+        assert cls.get_total_cards_batch(np.array([], dtype=np.int64)) == 0
+
+    @classmethod
+    def test_iter_total_cards(cls):
+        # Provided test case
+        f = io.StringIO(
+            """Card 1: 41 48 83 86 17 | 83 86  6 31 17  9 48 53
+Card 2: 13 32 20 16 61 | 61 30 68 82 17 32 24 19
+Card 3:  1 21 53 59 44 | 69 82 63 72 16 21 14  1
+Card 4: 41 92 73 84 69 | 59 84 76 51 58  5 54 83
+Card 5: 87 83 26 28 32 | 88 30 70 12 93 22 82 36
+Card 6: 31 18 13 56 72 | 74 77 10 23 35 67 36 11"""
+        )
+        assert list(cls.iter_total_cards(f)) == [1, 3, 7, 15, 29, 30]
+        assert list(cls.iter_total_cards([])) == []
+
     @classmethod
     def parse_file(cls) -> int:
         with open("input.txt", "r") as f:
-            return cls._parse_file(f)
+            total = 0
+            for total in cls.iter_total_cards(f):
+                pass
+            return total
 
 
 if __name__ == "__main__":
+    Part01.test_count_matches()
     Part01.test_parse_line()
+    Part01.test_get_score_batch()
     Part02.test_parse_file()
+    Part02.test_iter_total_cards()
+    Part02.test_get_total_cards_batch()
 
     print(Part01.parse_file())
     print(Part02.parse_file())
@@ -1,5 +1,11 @@
+import bisect
+import heapq
 import io
-from dataclasses import dataclass
+from array import array
+from dataclasses import dataclass, field
+from typing import Iterator, Self
+
+import numpy as np
 
 
 @dataclass
@@ -13,6 +19,122 @@ class SeedRange:
         return self.start + self.steps - 1
 
 
+@dataclass
+class RangeSet:
+    """Compact set of seed ranges, stored in parallel arrays
+
+    Ranges are kept sorted, disjoint and never touching each other
+    """
+
+    starts: array = field(default_factory=lambda: array("q"))
+    lengths: array = field(default_factory=lambda: array("q"))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def from_seed_ranges(cls, seed_ranges: list[SeedRange]) -> Self:
+        return cls._from_arrays(
+            array("q", (seed_range.start for seed_range in seed_ranges)),
+            array("q", (seed_range.steps for seed_range in seed_ranges)),
+        )
+
+    @classmethod
+    def _from_arrays(cls, starts: array, lengths: array) -> Self:
+        """Build a RangeSet from ranges in any order, possibly overlapping"""
+        range_set = cls()
+        np_starts = np.frombuffer(starts, dtype=np.int64)
+        if np.all(np_starts[:-1] <= np_starts[1:]):
+            order = range(len(starts))
+        else:
+            order = np.argsort(np_starts, kind="stable").tolist()
+        for idx in order:
+            range_set._append(starts[idx], lengths[idx])
+        return range_set
+
+    def _append(self, start: int, length: int):
+        """Append a range starting after the start of the last one"""
+        if length <= 0:
+            return
+        if self.starts and start <= self.starts[-1] + self.lengths[-1]:
+            end = max(self.starts[-1] + self.lengths[-1], start + length)
+            self.lengths[-1] = end - self.starts[-1]
+            return
+        self.starts.append(start)
+        self.lengths.append(length)
+
+    def to_seed_ranges(self) -> list[SeedRange]:
+        return [
+            SeedRange(start, length) for start, length in zip(self.starts, self.lengths)
+        ]
+
+    def union(self, *others: Self) -> Self:
+        starts, lengths = self.starts[:], self.lengths[:]
+        for other in others:
+            starts += other.starts
+            lengths += other.lengths
+        return self._from_arrays(starts, lengths)
+
+    def intersection(self, start: int, end: int) -> Self:
+        """Keep only the parts of the set inside [start, end] (inclusive)"""
+        res = type(self)()
+        first_idx = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        last_idx = bisect.bisect_right(self.starts, end)
+        for idx in range(first_idx, last_idx):
+            range_start = max(self.starts[idx], start)
+            range_end = min(self.starts[idx] + self.lengths[idx] - 1, end)
+            res._append(range_start, range_end - range_start + 1)
+        return res
+
+    def shift(self, offset: int) -> Self:
+        return type(self)(
+            array("q", (start + offset for start in self.starts)), self.lengths[:]
+        )
+
+    def min_start(self) -> int:
+        return self.starts[0]
+
+    @classmethod
+    def test_from_seed_ranges(cls):
+        range_set = cls.from_seed_ranges(
+            [SeedRange(10, 5), SeedRange(0, 10), SeedRange(30, 2), SeedRange(31, 0)]
+        )
+        assert range_set == cls(array("q", [0, 30]), array("q", [15, 2]))
+        assert range_set.to_seed_ranges() == [SeedRange(0, 15), SeedRange(30, 2)]
+        assert len(range_set) == 2
+
+    @classmethod
+    def test_union(cls):
+        range_set = cls.from_seed_ranges([SeedRange(0, 5), SeedRange(20, 5)])
+        assert range_set.union(
+            cls.from_seed_ranges([SeedRange(5, 2), SeedRange(40, 1)]),
+            cls.from_seed_ranges([SeedRange(22, 10)]),
+        ).to_seed_ranges() == [SeedRange(0, 7), SeedRange(20, 12), SeedRange(40, 1)]
+
+    @classmethod
+    def test_intersection(cls):
+        range_set = cls.from_seed_ranges(
+            [SeedRange(0, 5), SeedRange(20, 5), SeedRange(40, 5)]
+        )
+        assert range_set.intersection(3, 41).to_seed_ranges() == [
+            SeedRange(3, 2),
+            SeedRange(20, 5),
+            SeedRange(40, 2),
+        ]
+        assert range_set.intersection(10, 15).to_seed_ranges() == []
+        assert range_set.intersection(-10, -1).to_seed_ranges() == []
+        assert range_set.intersection(44, 100).to_seed_ranges() == [SeedRange(44, 1)]
+
+    @classmethod
+    def test_shift(cls):
+        range_set = cls.from_seed_ranges([SeedRange(0, 5), SeedRange(20, 5)])
+        assert range_set.shift(-3).to_seed_ranges() == [
+            SeedRange(-3, 5),
+            SeedRange(17, 5),
+        ]
+        assert range_set.shift(-3).min_start() == -3
+
+
 @dataclass
 class SectionMapping:
     """Represents one line of a section, eg '50 98 2'"""
@@ -188,6 +310,10 @@ class Section:
         # We could probably optimize the output to merge some SeedRange here
         return res
 
+    def get_corresponding_range_set(self, range_set: RangeSet) -> RangeSet:
+        """Same as get_corresponding_ranges, working on a RangeSet"""
+        return CompiledSection.from_section(self).get_corresponding_range_set(range_set)
+
     @classmethod
     def test_get_corresponding_destination(cls):
         section_mapping = cls(
@@ -233,6 +359,318 @@ class Section:
             SeedRange(0, 50),
         ]
 
+    @classmethod
+    def test_get_corresponding_range_set(cls):
+        section_mapping = cls(
+            mappings=[
+                SectionMapping(98, 50, 2),
+                SectionMapping(50, 52, 48),
+            ]
+        )
+        assert section_mapping.get_corresponding_range_set(
+            RangeSet.from_seed_ranges([SeedRange(96, 4)])
+        ).to_seed_ranges() == [SeedRange(50, 2), SeedRange(98, 2)]
+        assert section_mapping.get_corresponding_range_set(
+            RangeSet.from_seed_ranges([SeedRange(0, 150)])
+        ).to_seed_ranges() == [SeedRange(0, 150)]
+        assert section_mapping.get_corresponding_range_set(
+            RangeSet.from_seed_ranges([SeedRange(10, 5), SeedRange(99, 3)])
+        ).to_seed_ranges() == [SeedRange(10, 5), SeedRange(51, 1), SeedRange(100, 2)]
+        assert section_mapping.get_corresponding_range_set(RangeSet()) == RangeSet()
+
+
+@dataclass
+class CompiledSection:
+    """Sorted and array-backed version of a Section, looked up by bisection
+
+    Segments are non-overlapping and sorted by start. Each segment maps
+    [starts[i], ends[i]] (inclusive) to itself shifted by offsets[i].
+    Values outside of any segment are kept as is.
+    """
+
+    starts: array
+    ends: array
+    offsets: array
+
+    @classmethod
+    def from_section(cls, section: Section) -> Self:
+        """Compile a Section
+
+        When mappings overlap, the first one in the section wins,
+        just like in Section.get_corresponding_destination
+        """
+        # Sweep over the mapping boundaries, keeping track of the active
+        # mappings in a heap ordered by their position in the section
+        events: list[tuple[int, int]] = []
+        for priority, mapping in enumerate(section.mappings):
+            if mapping.steps > 0:
+                events.append((mapping.source_start, priority))
+                events.append((mapping.source_end + 1, priority))
+        events.sort()
+
+        compiled = cls(array("q"), array("q"), array("q"))
+        active: list[int] = []
+        ended: set[int] = set()
+        started: set[int] = set()
+        idx = 0
+        while idx < len(events):
+            position = events[idx][0]
+            while idx < len(events) and events[idx][0] == position:
+                priority = events[idx][1]
+                if priority in started:
+                    ended.add(priority)
+                else:
+                    started.add(priority)
+                    heapq.heappush(active, priority)
+                idx += 1
+            # Lazily drop mappings that are over
+            while active and active[0] in ended:
+                heapq.heappop(active)
+            if active and idx < len(events):
+                mapping = section.mappings[active[0]]
+                compiled._append(
+                    position,
+                    events[idx][0] - 1,
+                    mapping.destination_start - mapping.source_start,
+                )
+        return compiled
+
+    @classmethod
+    def from_sections(cls, sections: list[Section]) -> Self:
+        """Compose a whole almanac into a single seed-to-location CompiledSection"""
+        composed = cls(array("q"), array("q"), array("q"))
+        for section in sections:
+            composed = composed.compose(cls.from_section(section))
+        return composed
+
+    def compose(self, other: Self) -> Self:
+        """Build the CompiledSection equivalent to applying self, then other"""
+        composed = type(self)(array("q"), array("q"), array("q"))
+        if not self.starts and not other.starts:
+            return composed
+        # Outside of [low, high], both self and other keep values as is
+        low = min(x[0] for x in (self.starts, other.starts) if x)
+        high = max(x[-1] for x in (self.ends, other.ends) if x)
+        for start, end, offset in self._iter_segments(low, high):
+            for sub_start, sub_end, other_offset in other._iter_segments(
+                start + offset, end + offset
+            ):
+                composed._append(
+                    sub_start - offset, sub_end - offset, offset + other_offset
+                )
+        return composed
+
+    def _iter_segments(self, low: int, high: int) -> Iterator[tuple[int, int, int]]:
+        """Iterate over the (start, end, offset) segments covering [low, high]
+        Gaps between segments are yielded with an offset of 0
+        """
+        idx = max(bisect.bisect_right(self.starts, low) - 1, 0)
+        position = low
+        while position <= high:
+            if idx < len(self.starts) and self.starts[idx] <= position:
+                if position <= self.ends[idx]:
+                    end = min(self.ends[idx], high)
+                    yield position, end, self.offsets[idx]
+                    position = end + 1
+                idx += 1
+            else:
+                end = high
+                if idx < len(self.starts):
+                    end = min(self.starts[idx] - 1, high)
+                yield position, end, 0
+                position = end + 1
+
+    def _append(self, start: int, end: int, offset: int):
+        """Append a segment after the last one, merging them when possible"""
+        if offset == 0:
+            # Identity segments are implicit
+            return
+        if self.ends and self.ends[-1] + 1 == start and self.offsets[-1] == offset:
+            self.ends[-1] = end
+            return
+        self.starts.append(start)
+        self.ends.append(end)
+        self.offsets.append(offset)
+
+    def get_corresponding_destination(self, nb: int) -> int:
+        idx = bisect.bisect_right(self.starts, nb) - 1
+        if idx >= 0 and nb <= self.ends[idx]:
+            return nb + self.offsets[idx]
+        return nb
+
+    def get_corresponding_destinations(self, seeds: np.ndarray) -> np.ndarray:
+        """Vectorized version of get_corresponding_destination
+
+        Args:
+            seeds (np.ndarray): int64 array of values to process
+
+        Returns:
+            np.ndarray: int64 array of processed values
+        """
+        if not self.starts:
+            return seeds.copy()
+        # The arrays are typecode 'q', so they can be viewed as int64 without a copy
+        starts = np.frombuffer(self.starts, dtype=np.int64)
+        ends = np.frombuffer(self.ends, dtype=np.int64)
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)
+
+        indexes = np.searchsorted(starts, seeds, side="right") - 1
+        # Clip so that values before the first segment can still be indexed
+        clipped_indexes = np.maximum(indexes, 0)
+        in_segment = (indexes >= 0) & (seeds <= ends[clipped_indexes])
+        return seeds + np.where(in_segment, offsets[clipped_indexes], 0)
+
+    def get_corresponding_ranges(self, seed_ranges: list[SeedRange]) -> list[SeedRange]:
+        """Compute corresponding ranges for all seed_ranges
+
+        Args:
+            seed_ranges (list[SeedRange]): seed ranges to process
+
+        Returns:
+            list[SeedRange]: processed seed ranges, sorted and coalesced
+        """
+        return self.get_corresponding_range_set(
+            RangeSet.from_seed_ranges(seed_ranges)
+        ).to_seed_ranges()
+
+    def get_corresponding_range_set(self, range_set: RangeSet) -> RangeSet:
+        """Compute the RangeSet corresponding to range_set
+
+        Args:
+            range_set (RangeSet): seed ranges to process
+
+        Returns:
+            RangeSet: processed seed ranges
+        """
+        # Both the ranges and the segments are sorted, so a single sweep is enough
+        res_starts = array("q")
+        res_lengths = array("q")
+        idx = 0
+        for start, length in zip(range_set.starts, range_set.lengths):
+            position = start
+            range_end = start + length - 1
+            # Skip segments that are entirely before the current range
+            while idx < len(self.starts) and self.ends[idx] < position:
+                idx += 1
+            while position <= range_end:
+                if idx < len(self.starts) and self.starts[idx] <= position:
+                    end = min(self.ends[idx], range_end)
+                    res_starts.append(position + self.offsets[idx])
+                    if end == self.ends[idx]:
+                        idx += 1
+                else:
+                    # Not covered by any segment, keep it as is
+                    end = range_end
+                    if idx < len(self.starts):
+                        end = min(self.starts[idx] - 1, range_end)
+                    res_starts.append(position)
+                res_lengths.append(end - position + 1)
+                position = end + 1
+        # Offsets differ between segments, so the outputs are sorted only once here
+        return RangeSet._from_arrays(res_starts, res_lengths)
+
+    @classmethod
+    def test_from_section(cls):
+        compiled = cls.from_section(
+            Section(
+                mappings=[
+                    SectionMapping(98, 50, 2),
+                    SectionMapping(50, 52, 48),
+                ]
+            )
+        )
+        assert compiled == cls(
+            array("q", [50, 98]), array("q", [97, 99]), array("q", [2, -48])
+        )
+        # Overlapping mappings: the first one wins
+        compiled = cls.from_section(
+            Section(
+                mappings=[
+                    SectionMapping(10, 100, 5),
+                    SectionMapping(0, 200, 20),
+                ]
+            )
+        )
+        assert compiled == cls(
+            array("q", [0, 10, 15]),
+            array("q", [9, 14, 19]),
+            array("q", [200, 90, 200]),
+        )
+        # Empty section
+        assert cls.from_section(Section([])) == cls(array("q"), array("q"), array("q"))
+
+    @classmethod
+    def test_get_corresponding_destination(cls):
+        f = Part01._test_helper_get_example_input()
+        _, sections = Part01._parse_file(f)
+        for section in sections:
+            compiled = cls.from_section(section)
+            for nb in range(-5, 120):
+                assert compiled.get_corresponding_destination(
+                    nb
+                ) == section.get_corresponding_destination(nb)
+
+    @classmethod
+    def test_get_corresponding_destinations(cls):
+        f = Part01._test_helper_get_example_input()
+        _, sections = Part01._parse_file(f)
+        seeds = np.arange(-5, 120, dtype=np.int64)
+        for section in sections:
+            compiled = cls.from_section(section)
+            assert compiled.get_corresponding_destinations(seeds).tolist() == [
+                section.get_corresponding_destination(int(seed)) for seed in seeds
+            ]
+        assert cls.from_section(Section([])).get_corresponding_destinations(
+            seeds
+        ).tolist() == list(range(-5, 120))
+
+    @classmethod
+    def test_from_sections(cls):
+        f = Part01._test_helper_get_example_input()
+        _, sections = Part01._parse_file(f)
+        almanac = cls.from_sections(sections)
+        for seed in range(-5, 120):
+            location = seed
+            for section in sections:
+                location = section.get_corresponding_destination(location)
+            assert almanac.get_corresponding_destination(seed) == location
+        # Provided test cases
+        assert almanac.get_corresponding_destination(79) == 82
+        assert almanac.get_corresponding_destination(14) == 43
+        assert almanac.get_corresponding_destination(55) == 86
+        assert almanac.get_corresponding_destination(13) == 35
+
+    @classmethod
+    def test_get_corresponding_ranges(cls):
+        compiled = cls.from_section(
+            Section(
+                mappings=[
+                    SectionMapping(98, 50, 2),
+                    SectionMapping(50, 52, 48),
+                ]
+            )
+        )
+        assert compiled.get_corresponding_ranges([SeedRange(98, 1)]) == [
+            SeedRange(50, 1)
+        ]
+        # Outputs are sorted
+        assert compiled.get_corresponding_ranges([SeedRange(96, 4)]) == [
+            SeedRange(50, 2),
+            SeedRange(98, 2),
+        ]
+        # Outputs are merged when they touch
+        assert compiled.get_corresponding_ranges([SeedRange(0, 150)]) == [
+            SeedRange(0, 150),
+        ]
+        # Inputs are merged when they overlap
+        assert compiled.get_corresponding_ranges(
+            [SeedRange(60, 10), SeedRange(40, 25), SeedRange(120, 5)]
+        ) == [
+            SeedRange(40, 10),
+            SeedRange(52, 20),
+            SeedRange(120, 5),
+        ]
+
 
 class Part01:
     @classmethod
@@ -270,15 +708,31 @@ class Part01:
     @classmethod
     def get_lowest_location(cls, seeds: list[int], sections: list[Section]) -> int:
         lowest_location: int = -1
+        almanac = CompiledSection.from_sections(sections)
         for seed in seeds:
-            for section in sections:
-                seed = section.get_corresponding_destination(seed)
+            seed = almanac.get_corresponding_destination(seed)
             if lowest_location == -1:
                 lowest_location = seed
             else:
                 lowest_location = min(seed, lowest_location)
         return lowest_location
 
+    @classmethod
+    def parse_seed_array(cls, line: str) -> np.ndarray:
+        return np.array(Part01.parse_seed_line(line), dtype=np.int64)
+
+    @classmethod
+    def get_lowest_location_batch(
+        cls, seeds: np.ndarray, sections: list[Section]
+    ) -> int:
+        """Same as get_lowest_location, but maps all seeds at once with numpy"""
+        locations = seeds
+        for section in sections:
+            locations = CompiledSection.from_section(
+                section
+            ).get_corresponding_destinations(locations)
+        return int(locations.min()) if len(locations) else -1
+
     @classmethod
     def _test_helper_get_example_input(cls) -> io.TextIOWrapper:
         """Returns the example input in a TextIOWrapper"""
@@ -385,6 +839,16 @@ humidity-to-location map:
         seeds, sections = cls._parse_file(f)
         assert cls.get_lowest_location(seeds, sections) == 35
 
+    @classmethod
+    def test_get_lowest_location_batch(cls):
+        f = cls._test_helper_get_example_input()
+        seeds, sections = cls._parse_file(f)
+        assert cls.parse_seed_array("seeds: 79 14 55 13").tolist() == seeds
+        assert (
+            cls.get_lowest_location_batch(np.array(seeds, dtype=np.int64), sections)
+            == 35
+        )
+
     @classmethod
     def solve(cls) -> int:
         seeds: list[int] = []
@@ -411,15 +875,48 @@ class Part02(Part01):
 
     @classmethod
     def get_lowest_location(
-        cls, seed_ranges: list[SeedRange], sections: list[Section]
+        cls, seed_ranges: list[SeedRange] | RangeSet, sections: list[Section]
     ) -> int:
-        seed_ranges_to_proceed = seed_ranges
-        for section in sections:
-            seed_ranges_to_proceed = section.get_corresponding_ranges(
-                seed_ranges_to_proceed
-            )
+        if not isinstance(seed_ranges, RangeSet):
+            seed_ranges = RangeSet.from_seed_ranges(seed_ranges)
+        almanac = CompiledSection.from_sections(sections)
         # The min location is the start point of the range with the smallest start
-        return min(seed_range.start for seed_range in seed_ranges_to_proceed)
+        return almanac.get_corresponding_range_set(seed_ranges).min_start()
+
+    @classmethod
+    def find_lowest_location(
+        cls, seed_ranges: list[SeedRange], sections: list[Section]
+    ) -> tuple[int, int]:
+        """Find the lowest location, and the seed leading to it
+
+        Each segment of the composed almanac only shifts its values, so the lowest
+        location is always reached either at the start of a seed range, or at a
+        segment boundary (ie. a mapping boundary projected back to seed space).
+        Only those candidates are tested, whatever the width of the seed ranges.
+
+        Args:
+            seed_ranges (list[SeedRange]): seed ranges to process
+            sections (list[Section]): sections of the almanac
+
+        Returns:
+            tuple[int, int]: lowest location, and corresponding seed
+        """
+        almanac = CompiledSection.from_sections(sections)
+        breakpoints = sorted(set(almanac.starts) | {end + 1 for end in almanac.ends})
+
+        candidates: list[int] = []
+        for seed_range in seed_ranges:
+            if seed_range.steps <= 0:
+                continue
+            candidates.append(seed_range.start)
+            candidates += breakpoints[
+                bisect.bisect_right(
+                    breakpoints, seed_range.start
+                ) : bisect.bisect_right(breakpoints, seed_range.end)
+            ]
+        return min(
+            (almanac.get_corresponding_destination(seed), seed) for seed in candidates
+        )
 
     @classmethod
     def test_parse_seed_line(cls):
@@ -442,21 +939,43 @@ class Part02(Part01):
         f = cls._test_helper_get_example_input()
         seeds, sections = cls._parse_file(f)
         assert cls.get_lowest_location(seeds, sections) == 46
+        assert cls.get_lowest_location(RangeSet.from_seed_ranges(seeds), sections) == 46
+
+    @classmethod
+    def test_find_lowest_location(cls):
+        f = cls._test_helper_get_example_input()
+        seeds, sections = cls._parse_file(f)
+        # Provided test case: seed 82 leads to location 46
+        assert cls.find_lowest_location(seeds, sections) == (46, 82)
+        # Huge ranges are as fast as small ones
+        assert cls.find_lowest_location([SeedRange(0, 10**15)], sections) == (0, 70)
 
 
 if __name__ == "__main__":
+    RangeSet.test_from_seed_ranges()
+    RangeSet.test_union()
+    RangeSet.test_intersection()
+    RangeSet.test_shift()
     SectionMapping.test_get_corresponding_destination()
     Section.test_get_corresponding_destination()
+    CompiledSection.test_from_section()
+    CompiledSection.test_get_corresponding_destination()
+    CompiledSection.test_get_corresponding_destinations()
+    CompiledSection.test_from_sections()
     Part01.test_parse_seed_line()
     Part01.test_parse_section_line()
     Part01.test_parse_file()
     Part01.test_get_lowest_location()
+    Part01.test_get_lowest_location_batch()
 
     SectionMapping.test_get_corresponding_ranges()
     Section.test_get_corresponding_ranges()
+    CompiledSection.test_get_corresponding_ranges()
+    Section.test_get_corresponding_range_set()
     Part02.test_parse_seed_line()
     Part02.test_parse_file()
     Part02.test_get_lowest_location()
+    Part02.test_find_lowest_location()
 
     print(Part01.solve())
     print(Part02.solve())
@@ -1,5 +1,6 @@
 import math
 from collections import namedtuple
+from typing import Iterable
 
 Race = namedtuple("Race", ["time", "distance"])
 
@@ -12,14 +13,24 @@ class Part01:
 
     @classmethod
     def get_nb_ways_to_win(cls, race: Race) -> int:
-        # Guess I'm lazy today
-        # This could be solved by resolving the equation (race.time - x) * x > race.distance
-        # Then we could easily get min and max value that solves the equation
-        nb_wins = 0
-        for speed in range(1, race.time):
-            if (race.time - speed) * speed > race.distance:
-                nb_wins += 1
-        return nb_wins
+        # Holding the button for x ms wins if (race.time - x) * x > race.distance
+        # Winning hold times are between the roots of x^2 - time * x + distance,
+        # symmetric around time / 2, so we only need the smallest one
+        discriminant = race.time * race.time - 4 * race.distance
+        if discriminant < 0:
+            return 0
+        # isqrt rounds down, so this is at most the smallest winning hold time
+        hold_time = max((race.time - math.isqrt(discriminant)) // 2, 1)
+        # This loops at most twice
+        while (race.time - hold_time) * hold_time <= race.distance:
+            hold_time += 1
+            if 2 * hold_time > race.time:
+                return 0
+        return race.time - 2 * hold_time + 1
+
+    @classmethod
+    def get_nb_ways_to_win_batch(cls, races: Iterable[Race]) -> list[int]:
+        return [cls.get_nb_ways_to_win(race) for race in races]
 
     @classmethod
     def test_parse_line(cls):
@@ -30,6 +41,31 @@ class Part01:
     def test_get_nb_ways_to_win(cls):
         # Provided examples
         assert cls.get_nb_ways_to_win(Race(time=7, distance=9)) == 4
+        assert cls.get_nb_ways_to_win(Race(time=15, distance=40)) == 8
+        assert cls.get_nb_ways_to_win(Race(time=30, distance=200)) == 9
+        assert cls.get_nb_ways_to_win(Race(time=71530, distance=940200)) == 71503
+        # Boundaries
+        assert cls.get_nb_ways_to_win(Race(time=6, distance=9)) == 0
+        assert cls.get_nb_ways_to_win(Race(time=6, distance=8)) == 1
+        assert cls.get_nb_ways_to_win(Race(time=1, distance=0)) == 0
+        assert cls.get_nb_ways_to_win(Race(time=2, distance=0)) == 1
+        assert cls.get_nb_ways_to_win(Race(time=0, distance=0)) == 0
+        # Arbitrarily large integers
+        assert cls.get_nb_ways_to_win(Race(time=10**40, distance=0)) == 10**40 - 1
+        # Same results as the naive approach
+        for time in range(0, 40):
+            for distance in range(0, time * time // 4 + 2):
+                assert cls.get_nb_ways_to_win(Race(time, distance)) == sum(
+                    (time - x) * x > distance for x in range(1, time)
+                )
+
+    @classmethod
+    def test_get_nb_ways_to_win_batch(cls):
+        # Provided examples
+        assert cls.get_nb_ways_to_win_batch(
+            [Race(7, 9), Race(15, 40), Race(30, 200)]
+        ) == [4, 8, 9]
+        assert cls.get_nb_ways_to_win_batch([]) == []
 
     @classmethod
     def parse_file(cls) -> int:
@@ -40,7 +76,7 @@ class Part01:
         distances = cls.parse_line(lines[1])
         races = [Race(x, y) for x, y in zip(times, distances)]
 
-        return math.prod(cls.get_nb_ways_to_win(race) for race in races)
+        return math.prod(cls.get_nb_ways_to_win_batch(races))
 
 
 class Part02(Part01):
@@ -66,6 +102,7 @@ class Part02(Part01):
 if __name__ == "__main__":
     Part01.test_parse_line()
     Part01.test_get_nb_ways_to_win()
+    Part01.test_get_nb_ways_to_win_batch()
     Part02.test_parse_line()
 
     print(Part01.parse_file())
@@ -1,10 +1,27 @@
+import contextlib
+import functools
+import hashlib
+import heapq
+import io
+import itertools
+import os
+import struct
+import tempfile
+from array import array
 from collections import Counter
 from dataclasses import dataclass
 from enum import IntEnum
-from functools import total_ordering
-from typing import Self
+from operator import attrgetter, itemgetter
+from pathlib import Path
+from typing import IO, Iterator, Self
+
+import numpy as np
 
 CARDS_ORDER = "23456789TJQKA"
+# (rank, bid) of a hand, as stored by Part01._parse_file_external
+HAND_RECORD = struct.Struct("<qq")
+# Bump the version whenever the way hands are valued changes
+VALUES_TABLE_HEADER = b"HANDVALUES\x01"
 
 
 class HandValue(IntEnum):
@@ -17,33 +34,103 @@ class HandValue(IntEnum):
     HIGH_CARD = 0
 
 
-@dataclass
-@total_ordering
+@dataclass(slots=True)
 class Hand:
     cards: str
     bid: int
-    cards_counter: Counter
+    value: HandValue
+    rank: int
     CARDS_ORDER = "23456789TJQKA"
+    # 3 bits for the hand value, then 4 bits per card
+    RANK_BITS = 23
 
     def __init__(self, cards: str, bid: int = 0):
         self.cards = cards
         self.bid = bid
-        self.cards_counter = Counter(self.cards)
+        cards_ranks = [self.CARDS_ORDER.index(card) for card in cards]
+        table_idx = 0
+        for card_rank in cards_ranks:
+            table_idx = table_idx * len(self.CARDS_ORDER) + card_rank
+        self.value = HandValue(self.get_values_table()[table_idx])
+        # Pack the hand value in the high bits, then each card on 4 bits,
+        # so that comparing hands is comparing integers
+        self.rank = int(self.value)
+        for card_rank in cards_ranks:
+            self.rank = (self.rank << 4) | card_rank
 
     def __eq__(self, other: Self):
         return self.cards == other.cards
 
     def __lt__(self, other: Self) -> bool:
-        if self.value != other.value:
-            return self.value < other.value
-        for c1, c2 in zip(self.cards, other.cards):
-            if c1 != c2:
-                return self.CARDS_ORDER.index(c1) < self.CARDS_ORDER.index(c2)
-        return False
-
-    @property
-    def value(self) -> int:
-        match [x[1] for x in self.cards_counter.most_common()]:
+        return self.rank < other.rank
+
+    @classmethod
+    def get_cards_counter(cls, cards: str) -> Counter:
+        return Counter(cards)
+
+    @classmethod
+    @functools.cache
+    def get_values_table(cls) -> bytes:
+        """Get the HandValue of every possible hand
+        Hands are indexed by the position of their cards in CARDS_ORDER, in base 13
+
+        The table is only computed once, then stored next to this file
+        """
+        path = Path(__file__).with_name(f"hand_values_{cls.CARDS_ORDER}.bin")
+        if (table := cls._read_values_table(path)) is not None:
+            return table
+
+        table = bytes(
+            cls.get_value(cls.get_cards_counter("".join(cards)))
+            for cards in itertools.product(cls.CARDS_ORDER, repeat=5)
+        )
+        try:
+            cls._write_values_table(path, table)
+        except OSError:
+            # Storing the table is only an optimization
+            pass
+        return table
+
+    @classmethod
+    def _read_values_table(cls, path: Path) -> bytes | None:
+        """Read a table stored by _write_values_table
+        Returns None if it is missing, from another version, or corrupted
+        """
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        header, digest, table = (
+            data[: len(VALUES_TABLE_HEADER)],
+            data[len(VALUES_TABLE_HEADER) : len(VALUES_TABLE_HEADER) + 32],
+            data[len(VALUES_TABLE_HEADER) + 32 :],
+        )
+        if (
+            header != VALUES_TABLE_HEADER
+            or len(table) != len(cls.CARDS_ORDER) ** 5
+            or hashlib.sha256(table).digest() != digest
+        ):
+            return None
+        return table
+
+    @classmethod
+    def _write_values_table(cls, path: Path, table: bytes):
+        """Store the table with a version header and a checksum
+        The file is replaced atomically, so readers never see a partial table
+        """
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, prefix=path.name, delete=False
+        ) as f:
+            f.write(VALUES_TABLE_HEADER + hashlib.sha256(table).digest() + table)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.unlink(f.name)
+            raise
+
+    @classmethod
+    def get_value(cls, cards_counter: Counter) -> HandValue:
+        match [x[1] for x in cards_counter.most_common()]:
             case [5]:
                 return HandValue.FIVE_OF_A_KIND
             case [4, 1]:
@@ -69,6 +156,101 @@ class Hand:
         assert cls("A23A4").value == HandValue.ONE_PAIR
         assert cls("23456").value == HandValue.HIGH_CARD
 
+    @classmethod
+    def get_cards_ranks_batch(cls, cards: list[str]) -> np.ndarray:
+        """Convert hands to a (n, 5) matrix of the cards position in CARDS_ORDER
+
+        Raises:
+            ValueError: if a hand is not made of exactly 5 known cards
+        """
+        if invalid_lengths := set(map(len, cards)) - {5}:
+            raise ValueError(f"Hands must have 5 cards, got {min(invalid_lengths)}")
+        # Unknown cards are mapped to an invalid position
+        lookup = np.full(256, 255, dtype=np.uint8)
+        for idx, card in enumerate(cls.CARDS_ORDER):
+            lookup[ord(card)] = idx
+        cards_bytes = np.frombuffer("".join(cards).encode("ascii"), dtype=np.uint8)
+        cards_ranks = lookup[cards_bytes].reshape(-1, 5)
+        if (invalid_hands := np.flatnonzero((cards_ranks == 255).any(axis=1))).size:
+            raise ValueError(f"Unknown card in hand {cards[invalid_hands[0]]}")
+        return cards_ranks
+
+    @classmethod
+    def get_cards_counts_batch(cls, cards_ranks: np.ndarray) -> np.ndarray:
+        """Vectorized version of get_cards_counter, as a (n, 13) matrix"""
+        return (cards_ranks[:, :, np.newaxis] == np.arange(len(cls.CARDS_ORDER))).sum(
+            axis=1
+        )
+
+    @classmethod
+    def get_value_batch(cls, cards_counts: np.ndarray) -> np.ndarray:
+        """Vectorized version of get_value"""
+        sorted_counts = np.sort(cards_counts, axis=1)
+        first, second = sorted_counts[:, -1], sorted_counts[:, -2]
+        return np.select(
+            [
+                first == 5,
+                first == 4,
+                (first == 3) & (second == 2),
+                first == 3,
+                (first == 2) & (second == 2),
+                first == 2,
+            ],
+            [
+                HandValue.FIVE_OF_A_KIND,
+                HandValue.FOUR_OF_A_KIND,
+                HandValue.FULL_HOUSE,
+                HandValue.THREE_OF_A_KIND,
+                HandValue.TWO_PAIR,
+                HandValue.ONE_PAIR,
+            ],
+            HandValue.HIGH_CARD,
+        )
+
+    @classmethod
+    def get_rank_batch(cls, cards_ranks: np.ndarray) -> np.ndarray:
+        """Vectorized version of the packed rank computed in __init__"""
+        cards_counts = cls.get_cards_counts_batch(cards_ranks)
+        rank = cls.get_value_batch(cards_counts).astype(np.int64)
+        for card_idx in range(cards_ranks.shape[1]):
+            rank = (rank << 4) | cards_ranks[:, card_idx]
+        return rank
+
+    @classmethod
+    def test_get_values_table(cls):
+        table = cls.get_values_table()
+        assert len(table) == 13**5
+        assert table[0] == HandValue.FIVE_OF_A_KIND
+        assert table[1] == HandValue.FOUR_OF_A_KIND
+        for cards in ("AAAAA", "AA8AA", "23332", "TTT98", "23432", "A23A4", "23456"):
+            assert cls(cards).value == cls.get_value(cls.get_cards_counter(cards))
+
+    @classmethod
+    def test_read_values_table(cls):
+        table = cls.get_values_table()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "table.bin"
+            assert cls._read_values_table(path) is None
+            cls._write_values_table(path, table)
+            assert cls._read_values_table(path) == table
+            assert [x.name for x in Path(tmp_dir).iterdir()] == ["table.bin"]
+
+            # A table of the right size without header, or with a corrupted entry
+            path.write_bytes(table)
+            assert cls._read_values_table(path) is None
+            cls._write_values_table(path, table)
+            data = bytearray(path.read_bytes())
+            data[-1] ^= 1
+            path.write_bytes(data)
+            assert cls._read_values_table(path) is None
+
+    @classmethod
+    def test_rank(cls):
+        assert cls("23456").rank == 0x001234
+        assert cls("AAAAA").rank == 0x6CCCCC
+        assert cls("T55J5").rank == 0x383393
+        assert not hasattr(cls("AAAAA"), "__dict__")
+
     @classmethod
     def test_cmp(cls):
         assert cls("AAAAA") > cls("AA8AA") > cls("23332")
@@ -78,14 +260,28 @@ class Hand:
 
 
 class HandWithJoker(Hand):
+    __slots__ = ()
     CARDS_ORDER = "J23456789TQKA"
 
-    def __init__(self, cards: str, bid: int = 0):
-        super().__init__(cards, bid)
-        if self.cards != "JJJJJ" and "J" in self.cards_counter:
-            nb_jokers = self.cards_counter.pop("J")
-            most_common_key, _ = self.cards_counter.most_common(1)[0]
-            self.cards_counter[most_common_key] += nb_jokers
+    @classmethod
+    def get_cards_counter(cls, cards: str) -> Counter:
+        cards_counter = Counter(cards)
+        if cards != "JJJJJ" and "J" in cards_counter:
+            nb_jokers = cards_counter.pop("J")
+            most_common_key, _ = cards_counter.most_common(1)[0]
+            cards_counter[most_common_key] += nb_jokers
+        return cards_counter
+
+    @classmethod
+    def get_cards_counts_batch(cls, cards_ranks: np.ndarray) -> np.ndarray:
+        cards_counts = super().get_cards_counts_batch(cards_ranks)
+        joker_idx = cls.CARDS_ORDER.index("J")
+        nb_jokers = cards_counts[:, joker_idx].copy()
+        cards_counts[:, joker_idx] = 0
+        # For JJJJJ, every count is 0 so the jokers go back to the joker column
+        most_common_idx = cards_counts.argmax(axis=1)
+        cards_counts[np.arange(len(cards_counts)), most_common_idx] += nb_jokers
+        return cards_counts
 
     @classmethod
     def test_value(cls):
@@ -98,6 +294,20 @@ class HandWithJoker(Hand):
         assert cls("JJ432").value == HandValue.THREE_OF_A_KIND
         assert cls("JJ4J2").value == HandValue.FOUR_OF_A_KIND
 
+    @classmethod
+    def test_get_values_table(cls):
+        table = cls.get_values_table()
+        assert len(table) == 13**5
+        assert table[0] == HandValue.FIVE_OF_A_KIND
+        for cards in ("JJJJJ", "AA8AJ", "2J332", "TTJ98", "2J456", "JJ432", "JJ4J2"):
+            assert cls(cards).value == cls.get_value(cls.get_cards_counter(cards))
+
+    @classmethod
+    def test_rank(cls):
+        assert cls("J2345").rank == 0x101234
+        assert cls("JJJJJ").rank == 0x600000
+        assert not hasattr(cls("JJJJJ"), "__dict__")
+
     @classmethod
     def test_cmp(cls):
         assert cls("KTJJT") > cls("QQQJA") > cls("T55J5") > cls("KK677") > cls("32T3K")
@@ -105,39 +315,514 @@ class HandWithJoker(Hand):
         assert cls("JJ432") < cls("22243")
 
 
+class FenwickTree:
+    """Binary indexed tree, giving prefix sums with O(log n) updates"""
+
+    def __init__(self, size: int):
+        self.tree = array("q", [0]) * (size + 1)
+
+    def add(self, idx: int, delta: int):
+        idx += 1
+        while idx < len(self.tree):
+            self.tree[idx] += delta
+            idx += idx & -idx
+
+    def __len__(self) -> int:
+        return len(self.tree) - 1
+
+    def prefix_sum(self, idx: int) -> int:
+        """Sum of the values in [0, idx)"""
+        res = 0
+        while idx > 0:
+            res += self.tree[idx]
+            idx -= idx & -idx
+        return res
+
+    def grow(self):
+        """Double the size of the tree, which must be a power of 2
+        Only the new last node covers old values, as it covers the whole tree
+        """
+        size = len(self)
+        total = self.prefix_sum(size)
+        self.tree.extend(array("q", [0]) * size)
+        self.tree[-1] = total
+
+    @classmethod
+    def test_prefix_sum(cls):
+        tree = cls(10)
+        tree.add(0, 5)
+        tree.add(3, 2)
+        tree.add(9, 1)
+        assert [tree.prefix_sum(idx) for idx in range(11)] == [
+            0, 5, 5, 5, 7, 7, 7, 7, 7, 7, 8
+        ]  # fmt: skip
+        tree.add(3, -2)
+        assert tree.prefix_sum(10) == 6
+
+    @classmethod
+    def test_grow(cls):
+        tree = cls(1)
+        values = []
+        for value in range(1, 20):
+            if len(values) == len(tree):
+                tree.grow()
+            tree.add(len(values), value)
+            values.append(value)
+            assert [tree.prefix_sum(idx) for idx in range(len(values) + 1)] == [
+                sum(values[:idx]) for idx in range(len(values) + 1)
+            ]
+        assert len(tree) == 32
+
+
+class RankedHandStore:
+    """Keeps hands ranked while they are inserted or deleted,
+    along with the total winnings of the stored hands
+
+    Hands with the same cards are ranked by insertion order, like a stable sort would
+    """
+
+    # Every possible key, see get_key
+    KEY_SPACE = (max(HandValue) + 1) * 13**5
+
+    def __init__(self):
+        self.total_winnings = 0
+        self.nb_hands = FenwickTree(self.KEY_SPACE)
+        self.bids = FenwickTree(self.KEY_SPACE)
+        # Hands with the same key are ordered by a per key sequence number,
+        # with their own trees indexed by that sequence number
+        self.next_sequence: dict[int, int] = {}
+        self.tied_nb_hands: dict[int, FenwickTree] = {}
+        self.tied_bids: dict[int, FenwickTree] = {}
+        # Stored hands by id, as different hands may have the same cards
+        self.sequences: dict[int, tuple[Hand, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.sequences)
+
+    @classmethod
+    def get_key(cls, hand: Hand) -> int:
+        """Compact version of Hand.rank, with the cards in base 13 instead of 4 bits"""
+        key = int(hand.value)
+        for shift in range(16, -1, -4):
+            key = key * 13 + ((hand.rank >> shift) & 0xF)
+        return key
+
+    def insert(self, hand: Hand):
+        if id(hand) in self.sequences:
+            raise ValueError(f"Hand {hand.cards} is already stored")
+        key = self.get_key(hand)
+        # The hand goes after every hand with a lower or equal key
+        position = self.nb_hands.prefix_sum(key + 1) + 1
+        # Every hand with a higher key goes up one rank
+        self.total_winnings += self.bids.prefix_sum(self.KEY_SPACE)
+        self.total_winnings -= self.bids.prefix_sum(key + 1)
+        self.total_winnings += position * hand.bid
+
+        self.nb_hands.add(key, 1)
+        self.bids.add(key, hand.bid)
+
+        sequence = self.next_sequence.get(key, 0)
+        self.next_sequence[key] = sequence + 1
+        tied_nb_hands = self.tied_nb_hands.setdefault(key, FenwickTree(1))
+        tied_bids = self.tied_bids.setdefault(key, FenwickTree(1))
+        while sequence >= len(tied_nb_hands):
+            tied_nb_hands.grow()
+            tied_bids.grow()
+        tied_nb_hands.add(sequence, 1)
+        tied_bids.add(sequence, hand.bid)
+        self.sequences[id(hand)] = (hand, sequence)
+
+    def delete(self, hand: Hand):
+        """Delete this exact hand object
+
+        Raises:
+            KeyError: if the hand is not stored
+        """
+        stored_hand, sequence = self.sequences.get(id(hand), (None, 0))
+        if stored_hand is not hand:
+            raise KeyError(hand.cards)
+        del self.sequences[id(hand)]
+        key = self.get_key(hand)
+        tied_nb_hands = self.tied_nb_hands[key]
+        tied_bids = self.tied_bids[key]
+
+        position = (
+            self.nb_hands.prefix_sum(key) + tied_nb_hands.prefix_sum(sequence) + 1
+        )
+        # Every hand after it goes down one rank
+        self.total_winnings -= self.bids.prefix_sum(self.KEY_SPACE)
+        self.total_winnings += self.bids.prefix_sum(key + 1)
+        self.total_winnings -= tied_bids.prefix_sum(len(tied_bids))
+        self.total_winnings += tied_bids.prefix_sum(sequence + 1)
+        self.total_winnings -= position * hand.bid
+
+        self.nb_hands.add(key, -1)
+        self.bids.add(key, -hand.bid)
+        tied_nb_hands.add(sequence, -1)
+        tied_bids.add(sequence, -hand.bid)
+        if not tied_nb_hands.prefix_sum(len(tied_nb_hands)):
+            del self.next_sequence[key], self.tied_nb_hands[key], self.tied_bids[key]
+
+    @classmethod
+    def test_insert(cls):
+        for part in (Part01, Part02):
+            hands = part._parse_file(part._test_helper_get_example_input())
+            store = cls()
+            for idx, hand in enumerate(hands):
+                store.insert(hand)
+                assert store.total_winnings == part.get_total_winnings(hands[: idx + 1])
+            assert len(store) == len(hands)
+            # Same cards with different bids
+            duplicate = part.parse_line("KK677 3")
+            store.insert(duplicate)
+            assert store.total_winnings == part.get_total_winnings(hands + [duplicate])
+
+    @classmethod
+    def test_delete(cls):
+        for part in (Part01, Part02):
+            hands = part._parse_file(part._test_helper_get_example_input())
+            hands += [part.parse_line("KK677 3"), part.parse_line("KK677 5")]
+            store = cls()
+            for hand in hands:
+                store.insert(hand)
+            for idx in (-2, 0, 1, -1):
+                store.delete(hands[idx])
+                hands.pop(idx)
+                assert store.total_winnings == part.get_total_winnings(hands)
+            assert len(store) == len(hands)
+
+            # Many hands with the same cards, deleted in any order
+            nb_hands = len(hands)
+            hands += [part.parse_line(f"T55J5 {bid}") for bid in range(1, 40)]
+            for hand in hands[nb_hands:]:
+                store.insert(hand)
+            for idx in (5, 0, -1, 10, 3):
+                store.delete(hands.pop(nb_hands + idx if idx >= 0 else idx))
+                assert store.total_winnings == part.get_total_winnings(hands)
+
+            # Unknown hands, even with the same cards as stored ones
+            deleted_hand = hands.pop()
+            store.delete(deleted_hand)
+            for hand in (part.parse_line("T55J5 1"), deleted_hand):
+                try:
+                    store.delete(hand)
+                except KeyError:
+                    pass
+                else:
+                    raise AssertionError("Deleting an unknown hand should fail")
+
+
 class Part01:
+    HAND_TYPE: type[Hand] = Hand
+
     @classmethod
     def parse_line(cls, line: str) -> Hand:
         cards, bid = line.split()
         return Hand(cards, int(bid))
 
     @classmethod
-    def parse_file(cls) -> int:
-        hands: list[Hand] = []
-        with open("input.txt", "r") as f:
-            for line in f:
-                hands.append(cls.parse_line(line))
+    def _parse_file(cls, f: io.TextIOWrapper) -> list[Hand]:
+        return [cls.parse_line(line) for line in f]
 
-        hands = sorted(hands)
+    @classmethod
+    def get_total_winnings(cls, hands: list[Hand]) -> int:
+        hands = sorted(hands, key=attrgetter("rank"))
         res = 0
         for idx, hand in enumerate(hands):
             res += (idx + 1) * hand.bid
         return res
 
+    @classmethod
+    def radix_order(cls, ranks: np.ndarray) -> np.ndarray:
+        """Indexes sorting ranks, with a LSD radix sort on 16 bits digits
+
+        numpy sorts 16 bits integers with a stable radix sort in C,
+        so each pass is linear, and ties keep their order
+
+        Args:
+            ranks (np.ndarray): int64 ranks, below 2 ** Hand.RANK_BITS
+
+        Returns:
+            np.ndarray: indexes of the ranks in sorted order
+        """
+        order = np.arange(len(ranks))
+        for shift in range(0, Hand.RANK_BITS, 16):
+            digits = ((ranks[order] >> shift) & 0xFFFF).astype(np.uint16)
+            order = order[np.argsort(digits, kind="stable")]
+        return order
+
+    @classmethod
+    def radix_sort(cls, hands: list[Hand]) -> list[Hand]:
+        """Sort hands by rank in linear time
+
+        Args:
+            hands (list[Hand]): hands to sort
+
+        Returns:
+            list[Hand]: sorted hands
+        """
+        ranks = np.fromiter(map(attrgetter("rank"), hands), np.int64, len(hands))
+        return [hands[idx] for idx in cls.radix_order(ranks).tolist()]
+
+    @classmethod
+    def get_total_winnings_radix(cls, hands: list[Hand]) -> int:
+        """Same as get_total_winnings, but without any comparison sort"""
+        ranks = np.fromiter(map(attrgetter("rank"), hands), np.int64, len(hands))
+        bids = np.fromiter(map(attrgetter("bid"), hands), np.int64, len(hands))
+        return cls.get_sorted_bids_winnings(bids[cls.radix_order(ranks)])
+
+    @classmethod
+    def get_sorted_bids_winnings(cls, sorted_bids: np.ndarray) -> int:
+        """Total winnings of hands whose bids are sorted by rank"""
+        max_bid = int(np.abs(sorted_bids).max(initial=0))
+        if len(sorted_bids) * len(sorted_bids) * max_bid < 2**63:
+            return int((np.arange(1, len(sorted_bids) + 1) * sorted_bids).sum())
+        # The total may not fit in int64
+        return sum(idx * bid for idx, bid in enumerate(sorted_bids.tolist(), start=1))
+
+    @classmethod
+    def _parse_file_batch(cls, f: io.TextIOWrapper) -> tuple[np.ndarray, np.ndarray]:
+        """Parse the whole file without creating any Hand
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]:
+            - (n, 5) matrix of the cards position in CARDS_ORDER
+            - bids
+        """
+        tokens = f.read().split()
+        cards_ranks = cls.HAND_TYPE.get_cards_ranks_batch(tokens[0::2])
+        bids = np.array(tokens[1::2], dtype=np.int64)
+        return cards_ranks, bids
+
+    @classmethod
+    def get_total_winnings_batch(cls, cards_ranks: np.ndarray, bids: np.ndarray) -> int:
+        """Same as get_total_winnings, with every hand processed at once by numpy"""
+        rank = cls.HAND_TYPE.get_rank_batch(cards_ranks)
+        sorted_bids = bids[np.argsort(rank, kind="stable")]
+        max_bid = int(np.abs(bids).max(initial=0))
+        if len(bids) * len(bids) * max_bid < 2**63:
+            return int((np.arange(1, len(bids) + 1) * sorted_bids).sum())
+        # The total may not fit in int64
+        return sum(idx * bid for idx, bid in enumerate(sorted_bids.tolist(), start=1))
+
+    @classmethod
+    def _parse_file_external(
+        cls, f: io.TextIOWrapper, chunk_size: int = 1_000_000, fan_in: int = 16
+    ) -> int:
+        """Same as get_total_winnings on _parse_file, with a bounded memory usage
+
+        Hands are sorted by chunks of chunk_size lines, written to temporary files
+        as (rank, bid) records, then those sorted runs are merged by groups of at
+        most fan_in runs, until few enough are left to be merged in a single pass.
+        At most fan_in + 1 files are open at once, whatever the input size.
+
+        Args:
+            f (io.TextIOWrapper): hands file
+            chunk_size (int, optional): max number of hands in memory at once
+            fan_in (int, optional): max number of runs merged at once
+
+        Returns:
+            int: total winnings
+        """
+        if fan_in < 2:
+            raise ValueError("Runs must be merged at least two by two")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runs: list[Path] = []
+            for chunk in iter(lambda: list(itertools.islice(f, chunk_size)), []):
+                hands = sorted(map(cls.parse_line, chunk), key=attrgetter("rank"))
+                runs.append(Path(tmp_dir) / f"run{len(runs)}")
+                runs[-1].write_bytes(
+                    b"".join(HAND_RECORD.pack(x.rank, x.bid) for x in hands)
+                )
+
+            # Merge consecutive runs, so that the order of the hands on ties is kept
+            nb_runs = len(runs)
+            while len(runs) > fan_in:
+                merged_runs: list[Path] = []
+                for idx in range(0, len(runs), fan_in):
+                    merged_runs.append(Path(tmp_dir) / f"run{nb_runs}")
+                    nb_runs += 1
+                    cls._write_merged_run(runs[idx : idx + fan_in], merged_runs[-1])
+                runs = merged_runs
+
+            res = 0
+            with contextlib.ExitStack() as stack:
+                for idx, (_, bid) in enumerate(cls._merge_runs(runs, stack)):
+                    res += (idx + 1) * bid
+            return res
+
+    @classmethod
+    def _write_merged_run(cls, runs: list[Path], path: Path):
+        """Merge runs into a new run at path, deleting them afterwards"""
+        with contextlib.ExitStack() as stack, path.open("wb") as merged_run:
+            for rank, bid in cls._merge_runs(runs, stack):
+                merged_run.write(HAND_RECORD.pack(rank, bid))
+        for run in runs:
+            run.unlink()
+
+    @classmethod
+    def _merge_runs(
+        cls, runs: list[Path], stack: contextlib.ExitStack
+    ) -> Iterator[tuple[int, int]]:
+        """Merge (rank, bid) records of sorted runs, opened within stack"""
+        files = [stack.enter_context(run.open("rb")) for run in runs]
+        # heapq.merge keeps the order of the runs on ties, like a stable sort
+        return heapq.merge(*map(cls._read_run, files), key=itemgetter(0))
+
+    @classmethod
+    def _read_run(
+        cls, run: IO[bytes], buffer_size: int = 4096
+    ) -> Iterator[tuple[int, int]]:
+        """Read (rank, bid) records from a run written by _parse_file_external"""
+        while buffer := run.read(HAND_RECORD.size * buffer_size):
+            yield from HAND_RECORD.iter_unpack(buffer)
+
+    @classmethod
+    def _test_helper_get_example_input(cls) -> io.TextIOWrapper:
+        """Returns the example input in a TextIOWrapper"""
+        return io.StringIO(
+            """32T3K 765
+T55J5 684
+KK677 28
+KTJJT 220
+QQQJA 483"""
+        )
+
+    @classmethod
+    def test_get_total_winnings(cls):
+        # Provided test case
+        hands = cls._parse_file(cls._test_helper_get_example_input())
+        assert cls.get_total_winnings(hands) == 6440
+
+    @classmethod
+    def test_get_total_winnings_radix(cls):
+        hands = cls._parse_file(cls._test_helper_get_example_input())
+        assert cls.get_total_winnings_radix(hands) == cls.get_total_winnings(hands)
+        assert [hand.cards for hand in cls.radix_sort(hands)] == [
+            hand.cards for hand in sorted(hands)
+        ]
+        assert cls.get_total_winnings_radix([]) == 0
+
+        # Ties keep their order, and ranks use every bit
+        hands = [cls.parse_line(f"{cards} {bid}") for bid, cards in enumerate(
+            ["AAAAA", "23456", "KK677", "AAAAA", "23456", "QQQJA", "KK677"] * 3
+        )]  # fmt: skip
+        assert [hand.bid for hand in cls.radix_sort(hands)] == [
+            hand.bid for hand in sorted(hands)
+        ]
+        assert cls.get_total_winnings_radix(hands) == cls.get_total_winnings(hands)
+
+    @classmethod
+    def test_get_total_winnings_batch(cls):
+        f = cls._test_helper_get_example_input()
+        hands = cls._parse_file(cls._test_helper_get_example_input())
+        cards_ranks, bids = cls._parse_file_batch(f)
+        assert cards_ranks.shape == (5, 5)
+        assert bids.tolist() == [765, 684, 28, 220, 483]
+        assert cls.HAND_TYPE.get_rank_batch(cards_ranks).tolist() == [
+            hand.rank for hand in hands
+        ]
+        assert cls.get_total_winnings_batch(
+            cards_ranks, bids
+        ) == cls.get_total_winnings(hands)
+
+        # Every hand type, with and without jokers
+        cards = [
+            "AAAAA", "AA8AA", "23332", "TTT98", "23432", "A23A4", "23456",
+            "JJJJJ", "AA8AJ", "2J332", "TTJ98", "2J456", "JJ432", "JJ4J2",
+        ]  # fmt: skip
+        assert cls.HAND_TYPE.get_rank_batch(
+            cls.HAND_TYPE.get_cards_ranks_batch(cards)
+        ).tolist() == [cls.HAND_TYPE(x).rank for x in cards]
+
+        # Invalid hands
+        for cards in (["AAXAA"], ["AAAA", "KKKKKK"], ["AAAAé"], ["AAAAA", "23 45"]):
+            try:
+                cls.HAND_TYPE.get_cards_ranks_batch(cards)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"{cards} should be invalid")
+
+        # Totals too big for int64
+        bids = np.full(3, 2**61, dtype=np.int64)
+        cards_ranks = cls.HAND_TYPE.get_cards_ranks_batch(["23456", "AAAAA", "KKKKK"])
+        assert cls.get_total_winnings_batch(cards_ranks, bids) == 6 * 2**61
+
+    @classmethod
+    def test_parse_file_external(cls):
+        hands = cls._parse_file(cls._test_helper_get_example_input())
+        for chunk_size in (1, 2, 5, 100):
+            for fan_in in (2, 3, 16):
+                f = cls._test_helper_get_example_input()
+                assert cls._parse_file_external(
+                    f, chunk_size, fan_in
+                ) == cls.get_total_winnings(hands)
+        assert cls._parse_file_external(io.StringIO("")) == 0
+
+        # Several merge passes, with many ties
+        lines = [f"{cards} {bid}" for bid, cards in enumerate(["KK677", "T55J5"] * 20)]
+        hands = [cls.parse_line(line) for line in lines]
+        f = io.StringIO("\n".join(lines))
+        assert cls._parse_file_external(f, 1, 2) == cls.get_total_winnings(hands)
+
+    @classmethod
+    def parse_file(cls, external: bool = False) -> int:
+        """Solve the puzzle for input.txt
+
+        Args:
+            external (bool, optional): sort the hands on disk, for inputs that do
+                not fit in memory. Defaults to False.
+
+        Returns:
+            int: total winnings
+        """
+        with open("input.txt", "r") as f:
+            if external:
+                return cls._parse_file_external(f)
+            return cls.get_total_winnings(cls._parse_file(f))
+
 
 class Part02(Part01):
+    HAND_TYPE = HandWithJoker
+
     @classmethod
     def parse_line(cls, line: str) -> HandWithJoker:
         cards, bid = line.split()
         return HandWithJoker(cards, int(bid))
 
+    @classmethod
+    def test_get_total_winnings(cls):
+        # Provided test case
+        hands = cls._parse_file(cls._test_helper_get_example_input())
+        assert cls.get_total_winnings(hands) == 5905
+
 
 if __name__ == "__main__":
+    Hand.test_get_values_table()
+    Hand.test_read_values_table()
     Hand.test_value()
+    Hand.test_rank()
     Hand.test_cmp()
 
+    HandWithJoker.test_get_values_table()
     HandWithJoker.test_value()
+    HandWithJoker.test_rank()
     HandWithJoker.test_cmp()
 
+    Part01.test_get_total_winnings()
+    Part01.test_get_total_winnings_radix()
+    Part02.test_get_total_winnings()
+    Part02.test_get_total_winnings_radix()
+    Part01.test_get_total_winnings_batch()
+    Part02.test_get_total_winnings_batch()
+    Part01.test_parse_file_external()
+    Part02.test_parse_file_external()
+
+    FenwickTree.test_prefix_sum()
+    FenwickTree.test_grow()
+    RankedHandStore.test_insert()
+    RankedHandStore.test_delete()
+
     print(Part01.parse_file())
     print(Part02.parse_file())
@@ -1,13 +1,247 @@
+import functools
 import io
 import itertools
 import math
-from typing import TypeAlias
+import re
+from array import array
+from dataclasses import dataclass
+from typing import Self, TypeAlias
+
+import numpy as np
 
 Instructions: TypeAlias = list[int]
 Nodes: TypeAlias = dict[str, tuple[str, str]]
 
 
+@dataclass
+class Network:
+    """Nodes interned to dense integers, with successors stored in arrays
+
+    Node idx goes to successors[0][idx] on "L", and successors[1][idx] on "R"
+    """
+
+    names: list[str]
+    indexes: dict[str, int]
+    successors: tuple[array, array]
+    # Whether each node name ends with "A", or with "Z"
+    is_start: bytearray
+    is_end: bytearray
+
+    @classmethod
+    def from_nodes(cls, nodes: Nodes) -> Self:
+        return cls.from_successors(
+            list(nodes),
+            [left for left, _ in nodes.values()],
+            [right for _, right in nodes.values()],
+        )
+
+    @classmethod
+    def from_successors(
+        cls, names: list[str], lefts: list[str], rights: list[str]
+    ) -> Self:
+        """Build a Network where node names[i] goes to lefts[i] or rights[i]"""
+        indexes = {name: idx for idx, name in enumerate(names)}
+        return cls(
+            names=names,
+            indexes=indexes,
+            successors=(
+                array("i", map(indexes.__getitem__, lefts)),
+                array("i", map(indexes.__getitem__, rights)),
+            ),
+            is_start=bytearray(name.endswith("A") for name in names),
+            is_end=bytearray(name.endswith("Z") for name in names),
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def get_index(self, name: str) -> int:
+        return self.indexes[name]
+
+    def count_steps(self, instructions: Instructions, start: int, end: int) -> int:
+        nb_steps = 0
+        current = start
+        for next_idx in itertools.cycle(instructions):
+            current = self.successors[next_idx][current]
+            nb_steps += 1
+            if current == end:
+                break
+        return nb_steps
+
+    @classmethod
+    def test_from_nodes(cls):
+        network = cls.from_nodes(
+            {
+                "AAA": ("BBB", "BBB"),
+                "BBB": ("AAA", "ZZZ"),
+                "ZZZ": ("ZZZ", "ZZZ"),
+            }
+        )
+        assert network.names == ["AAA", "BBB", "ZZZ"]
+        assert network.successors == (array("i", [1, 0, 2]), array("i", [1, 2, 2]))
+        assert network.is_start == bytearray([1, 0, 0])
+        assert network.is_end == bytearray([0, 0, 1])
+        assert network.get_index("BBB") == 1
+        assert network.count_steps([0, 0, 1], 0, 2) == 6
+
+
+@dataclass
+class JumpTable:
+    """Where each node ends up after whole passes of the instructions,
+    with binary lifting tables to skip many passes at once
+
+    jumps[k][node] is the node reached after 2^k passes from node, and
+    first_hits[k][node] the first step of those passes reaching a target, or -1
+    """
+
+    nb_instructions: int
+    # Steps of a single pass reaching a target, for each node
+    hit_offsets: list[tuple[int, ...]]
+    jumps: list[array]
+    first_hits: list[array]
+
+    @classmethod
+    def from_network(
+        cls, network: Network, instructions: Instructions, is_target: bytearray
+    ) -> Self:
+        nb_instructions = len(instructions)
+        pass_ends = array("i", range(len(network)))
+        hit_offsets: list[tuple[int, ...]] = []
+        for node in range(len(network)):
+            offsets: list[int] = []
+            current = node
+            for offset, next_idx in enumerate(instructions, start=1):
+                current = network.successors[next_idx][current]
+                if is_target[current]:
+                    offsets.append(offset)
+            pass_ends[node] = current
+            hit_offsets.append(tuple(offsets))
+
+        jumps = [pass_ends]
+        first_hits = [array("q", (x[0] if x else -1 for x in hit_offsets))]
+        # Any reachable target is reached within len(network) passes
+        for level in range(len(network).bit_length()):
+            jump, first_hit = jumps[-1], first_hits[-1]
+            nb_steps = nb_instructions << level
+            next_jump = array("i", (jump[jump[node]] for node in range(len(network))))
+            next_first_hit = array("q", first_hit)
+            for node in range(len(network)):
+                if first_hit[node] == -1 and first_hit[jump[node]] != -1:
+                    next_first_hit[node] = nb_steps + first_hit[jump[node]]
+            jumps.append(next_jump)
+            first_hits.append(next_first_hit)
+        return cls(nb_instructions, hit_offsets, jumps, first_hits)
+
+    def count_steps(self, start: int) -> int:
+        """Count steps from start to the first target, or -1 if it's never reached"""
+        nb_steps = 0
+        current = start
+        for level in range(len(self.jumps) - 1, -1, -1):
+            if self.first_hits[level][current] == -1:
+                nb_steps += self.nb_instructions << level
+                current = self.jumps[level][current]
+        # The next pass reaches a target, unless there's none reachable
+        if not self.hit_offsets[current]:
+            return -1
+        return nb_steps + self.hit_offsets[current][0]
+
+    @classmethod
+    def test_count_steps(cls):
+        network = Network.from_nodes(
+            {
+                "AAA": ("BBB", "BBB"),
+                "BBB": ("AAA", "ZZZ"),
+                "ZZZ": ("ZZZ", "ZZZ"),
+            }
+        )
+        table = cls.from_network(network, [0, 0, 1], network.is_end)
+        assert table.hit_offsets == [(), (3,), (1, 2, 3)]
+        assert table.count_steps(0) == 6
+        assert table.count_steps(1) == 3
+        assert table.count_steps(2) == 1
+        # Unreachable target
+        table = cls.from_network(network, [0, 0, 1], bytearray(3))
+        assert table.count_steps(0) == -1
+
+        # Long walk: a ring of 1000 nodes, only going forward on "R"
+        nb_nodes = 1000
+        network = Network.from_nodes(
+            {
+                f"{idx:03}": (f"{idx:03}", f"{(idx + 1) % nb_nodes:03}")
+                for idx in range(nb_nodes)
+            }
+        )
+        is_target = bytearray(nb_nodes)
+        is_target[nb_nodes - 1] = 1
+        instructions = [0] * 9 + [1]
+        table = cls.from_network(network, instructions, is_target)
+        assert table.count_steps(0) == network.count_steps(
+            instructions, 0, nb_nodes - 1
+        )
+
+
+class StepIndex:
+    """Answers many step count queries on the same instructions and nodes
+
+    Jump tables are built once per target, and query results are memoized,
+    both in LRU caches holding at most maxsize entries
+    """
+
+    def __init__(self, instructions: Instructions, nodes: Nodes, maxsize: int = 128):
+        self.instructions = instructions
+        self.network = Network.from_nodes(nodes)
+        self.get_jump_table = functools.lru_cache(maxsize)(self._get_jump_table)
+        self.count_steps = functools.lru_cache(maxsize)(self._count_steps)
+
+    def _get_jump_table(self, end_key: str | None) -> JumpTable:
+        if end_key is None:
+            is_target = self.network.is_end
+        else:
+            is_target = bytearray(len(self.network))
+            is_target[self.network.get_index(end_key)] = 1
+        return JumpTable.from_network(self.network, self.instructions, is_target)
+
+    def _count_steps(self, start_key: str, end_key: str | None = None) -> int:
+        """Count steps from start_key to end_key, or -1 if it's never reached
+
+        Args:
+            start_key (str): starting node
+            end_key (str | None, optional): target node, or None for any node
+            ending with "Z"
+
+        Returns:
+            int: number of steps
+        """
+        jump_table = self.get_jump_table(end_key)
+        return jump_table.count_steps(self.network.get_index(start_key))
+
+    @classmethod
+    def test_count_steps(cls):
+        nodes = {
+            "AAA": ("BBB", "BBB"),
+            "BBB": ("AAA", "ZZZ"),
+            "ZZZ": ("ZZZ", "ZZZ"),
+        }
+        index = cls([0, 0, 1], nodes, maxsize=1)
+        assert index.count_steps("AAA", "ZZZ") == 6
+        assert index.count_steps("AAA") == 6
+        assert index.count_steps("BBB", "ZZZ") == 3
+        assert index.count_steps("ZZZ", "AAA") == -1
+        assert index.count_steps("AAA", "BBB") == 1
+        assert index.count_steps("BBB", "BBB") == 2
+        # Only the last query is kept
+        assert index.count_steps.cache_info().currsize == 1
+        assert index.get_jump_table.cache_info().currsize == 1
+        assert index.count_steps("AAA", "ZZZ") == Part01.count_steps_to_node(
+            [0, 0, 1], nodes, "AAA", "ZZZ"
+        )
+
+
 class Part01:
+    NODE_PATTERN = re.compile(
+        r"^\s*(\w+)\s*=\s*\(\s*(\w+)\s*,\s*(\w+)\s*\)", re.MULTILINE
+    )
+
     @classmethod
     def parse_line_instructions(cls, line: str) -> Instructions:
         line = line.replace("L", "0").replace("R", "1").strip()
@@ -22,28 +256,33 @@ class Part01:
 
     @classmethod
     def _parse_file(cls, f: io.TextIOWrapper) -> tuple[Instructions, Nodes]:
-        instructions: Instructions = []
-        nodes: Nodes = {}
-        for idx, line in enumerate(f):
-            if idx == 0:
-                instructions = cls.parse_line_instructions(line)
-            elif idx >= 2:
-                key, paths = cls.parse_line_node(line)
-                nodes[key] = paths
+        instructions = cls.parse_line_instructions(f.readline())
+        # Parse every node at once instead of line by line
+        nodes: Nodes = {
+            key: (left, right)
+            for key, left, right in cls.NODE_PATTERN.findall(f.read())
+        }
         return instructions, nodes
 
+    @classmethod
+    def _parse_file_network(cls, f: io.TextIOWrapper) -> tuple[Instructions, Network]:
+        """Same as _parse_file, building the Network without any intermediate dict"""
+        instructions = cls.parse_line_instructions(f.readline())
+        names, lefts, rights = [], [], []
+        for match in cls.NODE_PATTERN.finditer(f.read()):
+            names.append(match[1])
+            lefts.append(match[2])
+            rights.append(match[3])
+        return instructions, Network.from_successors(names, lefts, rights)
+
     @classmethod
     def count_steps_to_node(
         cls, instructions: Instructions, nodes: Nodes, start_key: str, end_key: str
     ) -> int:
-        nb_steps = 0
-        current_key = start_key
-        for next_idx in itertools.cycle(instructions):
-            current_key = nodes[current_key][next_idx]
-            nb_steps += 1
-            if current_key == end_key:
-                break
-        return nb_steps
+        network = Network.from_nodes(nodes)
+        return network.count_steps(
+            instructions, network.get_index(start_key), network.get_index(end_key)
+        )
 
     @classmethod
     def test_parse_line_instructions(cls):
@@ -64,6 +303,26 @@ ZZZ = (ZZZ, ZZZ)
         assert res[1]["AAA"] == ("BBB", "BBB")
         assert res[1]["BBB"] == ("AAA", "ZZZ")
         assert res[1]["ZZZ"] == ("ZZZ", "ZZZ")
+        assert len(res[1]) == 3
+
+        f.seek(0)
+        instructions, network = cls._parse_file_network(f)
+        assert instructions == [0, 0, 1]
+        assert network == Network.from_nodes(res[1])
+
+        # Same result as parsing line by line
+        f = io.StringIO(
+            """RL
+
+11A = (11B, XXX)
+ 22A=(  22B ,XXX)
+XXX = (XXX, XXX)
+"""
+        )
+        nodes = dict(
+            cls.parse_line_node(line) for line in f.getvalue().splitlines()[2:]
+        )
+        assert cls._parse_file(f)[1] == nodes
 
     @classmethod
     def test_parse_line_node(cls):
@@ -108,27 +367,181 @@ ZZZ = (ZZZ, ZZZ)
         with open("input.txt", "r") as f:
             return cls._parse_file(f)
 
+    @classmethod
+    def parse_file_network(cls) -> tuple[Instructions, Network]:
+        with open("input.txt", "r") as f:
+            return cls._parse_file_network(f)
+
     @classmethod
     def solve(cls) -> int:
-        instructions, nodes = cls.parse_file()
-        current_key = "AAA"
-        return cls.count_steps_to_node(instructions, nodes, current_key, "ZZZ")
+        instructions, network = cls.parse_file_network()
+        is_target = bytearray(len(network))
+        is_target[network.get_index("ZZZ")] = 1
+        table = JumpTable.from_network(network, instructions, is_target)
+        return table.count_steps(network.get_index("AAA"))
+
+
+@dataclass
+class GhostCycle:
+    """Steps at which a walk reaches an end node
+
+    The walk is in state (node, instruction index) after each step. Once a state
+    repeats, the walk loops forever: after prefix_length steps, it repeats every
+    cycle_length steps.
+    """
+
+    prefix_length: int
+    cycle_length: int
+    # Steps reaching an end node before the cycle
+    prefix_hits: list[int]
+    # Steps in [prefix_length, prefix_length + cycle_length) reaching an end node
+    cycle_hits: list[int]
+
+    @classmethod
+    def from_walk(
+        cls, network: Network, instructions: Instructions, start: int
+    ) -> Self:
+        nb_instructions = len(instructions)
+        first_seen: dict[int, int] = {}
+        hits: list[int] = []
+        current = start
+        nb_steps = 0
+        while (
+            state := current * nb_instructions + nb_steps % nb_instructions
+        ) not in first_seen:
+            first_seen[state] = nb_steps
+            current = network.successors[instructions[nb_steps % nb_instructions]][
+                current
+            ]
+            nb_steps += 1
+            if network.is_end[current]:
+                hits.append(nb_steps)
+        prefix_length = first_seen[state]
+        # The last step reached an already seen state, which is not part of the cycle
+        if hits and hits[-1] == nb_steps:
+            hits.pop()
+        return cls(
+            prefix_length=prefix_length,
+            cycle_length=nb_steps - prefix_length,
+            prefix_hits=[x for x in hits if x < prefix_length],
+            cycle_hits=[x for x in hits if x >= prefix_length],
+        )
+
+    def contains(self, nb_steps: int) -> bool:
+        """Whether the walk is on an end node after nb_steps"""
+        if nb_steps < self.prefix_length:
+            return nb_steps in self.prefix_hits
+        offset = (nb_steps - self.prefix_length) % self.cycle_length
+        return self.prefix_length + offset in self.cycle_hits
+
+    @classmethod
+    def test_from_walk(cls):
+        network = Network.from_nodes(
+            {
+                "11A": ("11B", "XXX"),
+                "11B": ("XXX", "11Z"),
+                "11Z": ("11B", "XXX"),
+                "XXX": ("XXX", "XXX"),
+            }
+        )
+        # 11A -> 11B -> 11Z -> 11B -> 11Z
+        cycle = cls.from_walk(network, [0, 1], 0)
+        assert cycle == cls(
+            prefix_length=1, cycle_length=2, prefix_hits=[], cycle_hits=[2]
+        )
+        assert [x for x in range(10) if cycle.contains(x)] == [2, 4, 6, 8]
+        # Ends are only reached before the cycle
+        network = Network.from_nodes(
+            {"A": ("Z", "Z"), "Z": ("X", "X"), "X": ("X", "X")}
+        )
+        cycle = cls.from_walk(network, [0], 0)
+        assert cycle == cls(
+            prefix_length=2, cycle_length=1, prefix_hits=[1], cycle_hits=[]
+        )
 
 
 class Part02(Part01):
     @classmethod
-    def solve(cls) -> int:
-        instructions, nodes = cls.parse_file()
-        current_keys = [key for key in nodes if key.endswith("A")]
-        len_keys = len(current_keys)
+    def count_ghosts_steps(cls, instructions: Instructions, network: Network) -> int:
+        """Count steps until every ghost is on an end node at the same time,
+        or -1 if it never happens
+
+        Each ghost walk is split into a prefix and a cycle, and the cycle hits
+        of all ghosts are combined with the chinese remainder theorem
+        """
+        cycles = [
+            GhostCycle.from_walk(network, instructions, node)
+            for node in range(len(network))
+            if network.is_start[node]
+        ]
+        if not cycles:
+            # Without ghosts, every ghost is trivially on an end node after one step,
+            # like count_ghosts_steps_lcm
+            return 1
+        # Before every ghost is in its cycle, only check the prefix hits
+        longest_prefix = max(cycles, key=lambda x: x.prefix_length)
+        for nb_steps in longest_prefix.prefix_hits:
+            if all(cycle.contains(nb_steps) for cycle in cycles):
+                return nb_steps
+
+        # Then, a solution is congruent to a cycle hit for every ghost
+        residues, modulus = {0}, 1
+        for cycle in cycles:
+            next_residues: set[int] = set()
+            for residue in residues:
+                for hit in cycle.cycle_hits:
+                    combined = cls.combine_congruences(
+                        residue, modulus, hit % cycle.cycle_length, cycle.cycle_length
+                    )
+                    if combined != -1:
+                        next_residues.add(combined)
+            residues = next_residues
+            modulus = math.lcm(modulus, cycle.cycle_length)
+        if not residues:
+            return -1
+
+        # Smallest step above every prefix, and not the starting point
+        min_steps = max(longest_prefix.prefix_length, 1)
+        res = -1
+        for residue in residues:
+            if residue < min_steps:
+                # Round up to the next step with the same residue
+                residue += (min_steps - residue + modulus - 1) // modulus * modulus
+            if res == -1 or residue < res:
+                res = residue
+        return res
+
+    @classmethod
+    def combine_congruences(cls, a: int, m: int, b: int, n: int) -> int:
+        """Find x in [0, lcm(m, n)) such as x = a mod m and x = b mod n,
+        or -1 if there's no solution
+        """
+        gcd = math.gcd(m, n)
+        if (b - a) % gcd:
+            return -1
+        lcm = m // gcd * n
+        factor = (b - a) // gcd * pow(m // gcd, -1, n // gcd) % (n // gcd)
+        return (a + m * factor) % lcm
+
+    @classmethod
+    def count_ghosts_steps_lcm(
+        cls, instructions: Instructions, network: Network
+    ) -> int:
+        """Simulate ghosts until each of them reached an end node, then take the lcm
+
+        Only valid if the first end node reached by a ghost starts its cycle
+        """
+        current_nodes = [idx for idx in range(len(network)) if network.is_start[idx]]
+        len_nodes = len(current_nodes)
         nb_steps = 0
-        steps_to_end = [0] * len_keys
+        steps_to_end = [0] * len_nodes
         for next_idx in itertools.cycle(instructions):
-            current_keys = [nodes[key][next_idx] for key in current_keys]
+            successors = network.successors[next_idx]
+            current_nodes = [successors[node] for node in current_nodes]
             nb_steps += 1
             # Store the required steps if it reached the end
-            for idx in range(len_keys):
-                if current_keys[idx].endswith("Z") and steps_to_end[idx] == 0:
+            for idx in range(len_nodes):
+                if network.is_end[current_nodes[idx]] and steps_to_end[idx] == 0:
                     steps_to_end[idx] = nb_steps
             # If we got all required steps for each key
             if all(required_steps != 0 for required_steps in steps_to_end):
@@ -136,12 +549,103 @@ class Part02(Part01):
 
         return math.lcm(*steps_to_end)
 
+    @classmethod
+    def count_ghosts_steps_numpy(
+        cls, instructions: Instructions, network: Network
+    ) -> int:
+        """Same as count_ghosts_steps_lcm, with every ghost moved at once by numpy"""
+        # array('i') and bytearray buffers are viewed without any copy
+        successors = [np.frombuffer(x, dtype=np.intc) for x in network.successors]
+        is_end = np.frombuffer(network.is_end, dtype=np.bool_)
+        current_nodes = np.flatnonzero(np.frombuffer(network.is_start, dtype=np.bool_))
+        steps_to_end = np.zeros(len(current_nodes), dtype=np.int64)
+        for nb_steps, next_idx in enumerate(itertools.cycle(instructions), start=1):
+            current_nodes = successors[next_idx][current_nodes]
+            # Store the required steps for ghosts reaching the end for the first time
+            steps_to_end[is_end[current_nodes] & (steps_to_end == 0)] = nb_steps
+            if steps_to_end.all():
+                break
+
+        return math.lcm(*steps_to_end.tolist())
+
+    @classmethod
+    def _test_helper_get_example_input(cls) -> io.TextIOWrapper:
+        """Returns the example input in a TextIOWrapper"""
+        return io.StringIO(
+            """LR
+
+11A = (11B, XXX)
+11B = (XXX, 11Z)
+11Z = (11B, XXX)
+22A = (22B, XXX)
+22B = (22C, 22C)
+22C = (22Z, 22Z)
+22Z = (22B, 22B)
+XXX = (XXX, XXX)
+"""
+        )
+
+    @classmethod
+    def test_combine_congruences(cls):
+        assert cls.combine_congruences(2, 3, 3, 5) == 8
+        assert cls.combine_congruences(1, 4, 3, 6) == 9
+        assert cls.combine_congruences(1, 4, 2, 6) == -1
+        assert cls.combine_congruences(0, 1, 4, 7) == 4
+
+    @classmethod
+    def test_count_ghosts_steps(cls):
+        # Provided test case
+        instructions, nodes = cls._parse_file(cls._test_helper_get_example_input())
+        network = Network.from_nodes(nodes)
+        assert cls.count_ghosts_steps(instructions, network) == 6
+        assert cls.count_ghosts_steps_lcm(instructions, network) == 6
+        assert cls.count_ghosts_steps_numpy(instructions, network) == 6
+
+        # Ghosts with a prefix, and several end nodes in their cycle
+        network = Network.from_nodes(
+            {
+                "1A": ("1B", "1B"),
+                "1B": ("1C", "1C"),
+                "1C": ("1Z", "1Z"),
+                "1Z": ("2Z", "2Z"),
+                "2Z": ("1X", "1X"),
+                "1X": ("1C", "1C"),
+                "2A": ("3Z", "3Z"),
+                "3Z": ("2B", "2B"),
+                "2B": ("2C", "2C"),
+                "2C": ("2B", "2B"),
+            }
+        )
+        # 1A reaches end nodes at steps 3, 4, 7, 8, 11, 12...
+        # 2A reaches an end node at step 1 only
+        assert cls.count_ghosts_steps([0], network) == -1
+        network.successors[0][network.get_index("2C")] = network.get_index("3Z")
+        # 2A now reaches an end node at steps 1, 4, 7, 10...
+        assert cls.count_ghosts_steps([0], network) == 4
+
+        # No ghost at all
+        network = Network.from_nodes({"AAB": ("ZZZ", "ZZZ"), "ZZZ": ("AAB", "AAB")})
+        assert cls.count_ghosts_steps([0], network) == 1
+        assert cls.count_ghosts_steps_lcm([0], network) == 1
+        assert cls.count_ghosts_steps_numpy([0], network) == 1
+
+    @classmethod
+    def solve(cls) -> int:
+        instructions, network = cls.parse_file_network()
+        return cls.count_ghosts_steps(instructions, network)
+
 
 if __name__ == "__main__":
+    Network.test_from_nodes()
+    JumpTable.test_count_steps()
+    StepIndex.test_count_steps()
     Part01.test_parse_line_instructions()
     Part01.test_parse_line_node()
     Part01.test_parse_file()
     Part01.test_count_steps_to_node()
+    GhostCycle.test_from_walk()
+    Part02.test_combine_congruences()
+    Part02.test_count_ghosts_steps()
 
     print(Part01.solve())
     print(Part02.solve())